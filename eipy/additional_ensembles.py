@@ -1,6 +1,7 @@
 from eipy.utils import (
     set_seed,
     f_minority_score,
+    f_minority_score_columns,
 )
 
 import numpy as np
@@ -14,6 +15,7 @@ import pandas as pd
 from sklearn.utils.validation import check_is_fitted
 from sklearn.base import BaseEstimator, ClassifierMixin
 from sklearn.utils.multiclass import unique_labels
+from joblib import Parallel, delayed
 
 
 class MeanAggregation(BaseEstimator, ClassifierMixin):
@@ -60,6 +62,11 @@ class MedianAggregation(BaseEstimator, ClassifierMixin):
         return np.transpose(np.array([1 - predict_positive, predict_positive]))
 
 
+# scoring functions of every column of a prediction matrix at once, used by CES
+# when no scoring_columns is given
+COLUMN_SCORERS = {f_minority_score: f_minority_score_columns}
+
+
 class CES(BaseEstimator, ClassifierMixin):
     """
     Caruana et al's Ensemble Selection.
@@ -67,6 +74,12 @@ class CES(BaseEstimator, ClassifierMixin):
     Caruana R. et al. (2006) Getting the most out of ensemble selection.
     In: Sixth International Conference on Data
     Mining (ICDM'06), 2006 IEEE, Piscataway, NJ, USA, pp. 828-833.
+
+    scoring_columns, if given, scores every column of a (n_samples,
+    n_columns) prediction matrix in one call, giving the same scores as
+    scoring_func on each column. If None, the function registered for
+    scoring_func in COLUMN_SCORERS is used, and otherwise scoring_func is
+    called on each column.
     """
 
     def __init__(
@@ -75,10 +88,12 @@ class CES(BaseEstimator, ClassifierMixin):
         max_ensemble_size=50,
         random_state=0,
         greater_is_better=True,
+        scoring_columns=None,
     ):
         set_seed(random_state)
         self.seed = random_state
         self.scoring_func = scoring_func
+        self.scoring_columns = scoring_columns
         self.max_ensemble_size = max_ensemble_size
         self.selected_ensemble = []
         self.train_performance = []
@@ -100,15 +115,28 @@ class CES(BaseEstimator, ClassifierMixin):
         self.train_performance = []
         # print(X, y)
         self.rng_generator = np.random.default_rng(seed=self.random_state)
-        best_classifiers = X.apply(lambda x: self.scoring_func(y, x)).sort_values(
-            ascending=self.greater_is_better
-        )
+
+        X_np = np.asarray(X, dtype=np.float64)
+        best_classifiers = pd.Series(
+            self.score_columns(y, X_np), index=range(X_np.shape[1])
+        ).sort_values(ascending=self.greater_is_better)
+
+        # predictions of the selected ensemble are kept as a running sum
+        self.ensemble_sum_ = np.zeros(X_np.shape[0])
         for i in range(min(self.max_ensemble_size, len(best_classifiers))):
-            best_candidate = self.select_candidate_enhanced(
-                X, y, best_classifiers, self.selected_ensemble, i
+            best_candidate, score = self.select_candidate_enhanced(
+                X_np, y, best_classifiers, self.selected_ensemble, i
+            )
+            self.ensemble_sum_ += X_np[:, best_candidate]
+            self.selected_ensemble.append(X.columns[best_candidate])
+            self.train_performance.append(
+                {
+                    "seed": self.seed,
+                    "score": score,
+                    "ensemble": self.selected_ensemble[-1],
+                    "ensemble_size": len(self.selected_ensemble),
+                }
             )
-            self.selected_ensemble.append(best_candidate)
-            self.train_performance.append(self.get_performance(X, y))
 
         train_performance_df = pd.DataFrame.from_records(self.train_performance)
         best_ensemble_size = self.get_best_performer(train_performance_df)[
@@ -128,7 +156,24 @@ class CES(BaseEstimator, ClassifierMixin):
         predict_positive = ces_bp_df.mean(axis=1).values
         return np.transpose(np.array([1 - predict_positive, predict_positive]))
 
+    def score_columns(self, y, X):
+        """
+        Score every column of a prediction array, in one call if a column
+        scoring function is available.
+        """
+        scoring_columns = self.scoring_columns
+        if scoring_columns is None:
+            scoring_columns = COLUMN_SCORERS.get(self.scoring_func)
+        if scoring_columns is not None:
+            return np.asarray(scoring_columns(y, X))
+        return np.array([self.scoring_func(y, X[:, j]) for j in range(X.shape[1])])
+
     def select_candidate_enhanced(self, X, y, best_classifiers, ensemble, i):
+        """
+        Select the next ensemble member among the columns of the array X,
+        returning its column position and the score of the ensemble with it.
+        Candidates are scored together as (ensemble_sum_ + x_c) / (k + 1).
+        """
         initial_ensemble_size = 2
         max_candidates = 50
         if len(ensemble) >= initial_ensemble_size:
@@ -137,25 +182,14 @@ class CES(BaseEstimator, ClassifierMixin):
                 min(max_candidates, len(best_classifiers)),
                 replace=False,
             )
-            candidate_scores = [
-                self.scoring_func(y, X[ensemble + [candidate]].mean(axis=1))
-                for candidate in candidates
-            ]
-            best_candidate = candidates[self.argbest(candidate_scores)]
         else:
-            best_candidate = best_classifiers.index.values[i]
-        return best_candidate
-
-    def get_performance(self, X, y):
-        predictions = X[self.selected_ensemble].mean(axis=1)
-        score = self.scoring_func(y, predictions)
-
-        return {
-            "seed": self.seed,
-            "score": score,
-            "ensemble": self.selected_ensemble[-1],
-            "ensemble_size": len(self.selected_ensemble),
-        }
+            candidates = best_classifiers.index.values[i : i + 1]
+        candidate_predictions = (self.ensemble_sum_[:, None] + X[:, candidates]) / (
+            len(ensemble) + 1
+        )
+        candidate_scores = self.score_columns(y, candidate_predictions)
+        best = self.argbest(candidate_scores)
+        return candidates[best], candidate_scores[best]
 
     def get_best_performer(self, df, one_se=False):
         if not one_se:
@@ -164,3 +198,119 @@ class CES(BaseEstimator, ClassifierMixin):
         if self.greater_is_better:
             return df[df.score >= (self.best(df.score) - se)].head(1)
         return df[df.score <= (self.best(df.score) + se)].head(1)
+
+
+def _fit_ces_bag(ces, X, y):
+    """
+    Fit CES on a bag of columns, returning its selections.
+    """
+    ces.fit(X, y)
+    return ces.selected_ensemble, list(ces.best_ensemble)
+
+
+class BaggedCES(BaseEstimator, ClassifierMixin):
+    """
+    Bagged ensemble selection.
+
+    Runs n_bags independent CES selections, each on a random subset of the
+    columns of X, in parallel. The ensembles selected in each bag are
+    averaged, so each column is weighted by its share of the bag ensembles.
+
+    Caruana R. et al. (2004) Ensemble selection from libraries of models.
+    In: Proceedings of the 21st International Conference on Machine Learning
+    (ICML'04), pp. 18-25.
+
+    Parameters
+    ----------
+    scoring_func : callable, default=f_minority_score
+        Score of predictions, as in CES.
+    max_ensemble_size : int, default=50
+        Maximum number of selections per bag.
+    n_bags : int, default=20
+        Number of bags.
+    bag_fraction : float, default=0.5
+        Fraction of the columns of X in each bag.
+    n_jobs : int, default=1
+        Number of bags fitted in parallel.
+    random_state : int, default=0
+        Seed of the column subsets and of the selection in each bag.
+    greater_is_better : bool, default=True
+        Whether higher scores are better.
+    scoring_columns : callable, default=None
+        Score of every column of a prediction matrix in one call, as in CES.
+
+    Attributes
+    ----------
+    weights_ : pandas.Series
+        Weight of each selected column in the merged ensemble.
+    selected_ensemble : list
+        Columns selected in every bag, concatenated, so that selection
+        frequencies can be read as in CES.
+    """
+
+    def __init__(
+        self,
+        scoring_func=f_minority_score,
+        max_ensemble_size=50,
+        n_bags=20,
+        bag_fraction=0.5,
+        n_jobs=1,
+        random_state=0,
+        greater_is_better=True,
+        scoring_columns=None,
+    ):
+        self.scoring_func = scoring_func
+        self.scoring_columns = scoring_columns
+        self.max_ensemble_size = max_ensemble_size
+        self.n_bags = n_bags
+        self.bag_fraction = bag_fraction
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+        self.greater_is_better = greater_is_better
+
+    def fit(self, X, y):
+        self.classes_ = unique_labels(y)
+
+        rng = np.random.default_rng(self.random_state)
+        n_columns = X.shape[1]
+        bag_size = min(n_columns, max(1, int(round(self.bag_fraction * n_columns))))
+        bags = [
+            np.sort(rng.choice(n_columns, bag_size, replace=False))
+            for _ in range(self.n_bags)
+        ]
+        seeds = rng.integers(0, 2**31 - 1, size=self.n_bags)
+
+        output = Parallel(n_jobs=self.n_jobs)(
+            delayed(_fit_ces_bag)(
+                CES(
+                    scoring_func=self.scoring_func,
+                    max_ensemble_size=self.max_ensemble_size,
+                    random_state=int(seed),
+                    greater_is_better=self.greater_is_better,
+                    scoring_columns=self.scoring_columns,
+                ),
+                X.iloc[:, bag],
+                y,
+            )
+            for bag, seed in zip(bags, seeds)
+        )
+
+        self.selected_ensemble = []
+        weights = {}
+        for selected_ensemble, best_ensemble in output:
+            self.selected_ensemble += selected_ensemble
+            for column in best_ensemble:
+                weights[column] = weights.get(column, 0) + 1 / (
+                    len(best_ensemble) * self.n_bags
+                )
+        self.weights_ = pd.Series(
+            list(weights.values()), index=list(weights), dtype=float
+        )
+        self.best_ensemble = list(weights)
+
+        return self
+
+    def predict_proba(self, X):
+        check_is_fitted(self)
+        predict_positive = X[self.best_ensemble].to_numpy() @ self.weights_.to_numpy()
+        return np.transpose(np.array([1 - predict_positive, predict_positive]))
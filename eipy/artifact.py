@@ -0,0 +1,92 @@
+import copy
+import os
+import pickle
+import joblib
+
+_STORES = ["meta_training_store", "meta_test_store", "meta_training_store_final"]
+
+
+class ModelFile:
+    """
+    Reference to a serialized model saved in an artifact directory. Stands in
+    for the model bytes in final_models, which are read from disk by
+    utils.load_model only when the model is used.
+    """
+
+    __slots__ = ["path"]
+
+    def __init__(self, path):
+        self.path = path
+
+    def read(self):
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def __repr__(self):
+        return f"ModelFile({self.path!r})"
+
+
+def save_directory(EI, path):
+    """
+    Save an EnsembleIntegration object as a directory holding:
+
+    - metadata.pkl: the object without meta data, fold plan and models
+    - fold_plan.joblib, <store>.joblib: fold indices and meta data, saved with
+      joblib so their arrays can be memory-mapped when loading
+    - models/: one file of serialized bytes per final base and meta model
+    """
+    os.makedirs(os.path.join(path, "models"), exist_ok=True)
+
+    metadata = copy.copy(EI)
+    for name in _STORES + ["fold_plan"]:
+        joblib.dump(getattr(EI, name), os.path.join(path, f"{name}.joblib"))
+        setattr(metadata, name, None)
+
+    base_models = {}
+    for i, (modality, models) in enumerate(EI.final_models["base models"].items()):
+        base_models[modality] = []
+        for j, d in enumerate(models):
+            filename = os.path.join("models", f"base_{i}_{j}.pkl")
+            _write_model(d["pickled model"], os.path.join(path, filename))
+            base_models[modality].append(dict(d, **{"pickled model": ModelFile(filename)}))
+
+    meta_models = {}
+    for i, (key, model) in enumerate(EI.final_models["meta models"].items()):
+        filename = os.path.join("models", f"meta_{i}.pkl")
+        _write_model(model, os.path.join(path, filename))
+        meta_models[key] = ModelFile(filename)
+
+    metadata.final_models = {"base models": base_models, "meta models": meta_models}
+    with open(os.path.join(path, "metadata.pkl"), "wb") as f:
+        pickle.dump(metadata, f)
+
+
+def load_directory(path, mmap_mode="r"):
+    """
+    Load an EnsembleIntegration object saved by save_directory. Arrays of the
+    meta data and fold plan are memory-mapped with mmap_mode (None to read
+    them into memory) and models are read on first use.
+    """
+    with open(os.path.join(path, "metadata.pkl"), "rb") as f:
+        EI = pickle.load(f)
+
+    for name in _STORES + ["fold_plan"]:
+        setattr(
+            EI, name, joblib.load(os.path.join(path, f"{name}.joblib"), mmap_mode)
+        )
+
+    for models in EI.final_models["base models"].values():
+        for d in models:
+            d["pickled model"] = ModelFile(os.path.join(path, d["pickled model"].path))
+    meta_models = EI.final_models["meta models"]
+    for key, model in meta_models.items():
+        meta_models[key] = ModelFile(os.path.join(path, model.path))
+
+    return EI
+
+
+def _write_model(model, path):
+    if isinstance(model, ModelFile):
+        model = model.read()
+    with open(path, "wb") as f:
+        f.write(model)
@@ -6,7 +6,11 @@ Ensemble Integration
 import pandas as pd
 import numpy as np
 import pickle
-import copy
+import os
+import shutil
+import tempfile
+import weakref
+import joblib
 from tqdm import tqdm
 from sklearn.utils._testing import ignore_warnings
 from sklearn.exceptions import ConvergenceWarning
@@ -16,23 +20,171 @@ from joblib import Parallel, delayed
 import warnings
 from sklearn.pipeline import Pipeline
 from eipy.utils import (
-    scores,
     set_seed,
     random_integers,
     sample,
-    retrieve_X_y,
-    append_modality,
     metric_threshold_dataframes,
     create_base_summary,
     safe_predict_proba,
-    dummy_cv,
+    dump_model,
+    model_size,
     bar_format,
     format_input_datatype
 )
+from eipy.store import MetaDataStore
+from eipy.folds import FoldPlan
+from eipy.inference import CompiledPredictor
+from eipy.artifact import save_directory, load_directory
 
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
 
+@ignore_warnings(category=ConvergenceWarning)
+def _train_predict_single_base_predictor(
+    X,
+    y,
+    model_params,
+    fold_params,
+    sample_state,
+    sampling_strategy=None,
+    calibration_model=None,
+    model_building=False,
+    cache_dir=None,
+    data_key=None,
+    sample_index=None,
+    dump_params=None,
+):
+    """
+    Train/test single base predictor, on a given training fold,
+    subject to a given sampling strategy.
+
+    Module-level so that joblib tasks only carry the data, estimator and
+    sampling configuration, not the EnsembleIntegration object. If cache_dir
+    is given, the result is stored under a hash of everything it depends on
+    and loaded from there when the same task is run again. If sample_index
+    is given, it holds the precomputed rows of the class-balanced sample of
+    the training fold. dump_params are passed to utils.dump_model when
+    serializing final models.
+    """
+
+    model_name, model = model_params
+
+    fold_id, (train_index, test_index) = fold_params
+    sample_id, sample_random_state = sample_state
+
+    if cache_dir is not None:
+        cache_path = os.path.join(
+            cache_dir,
+            joblib.hash(
+                (
+                    data_key,
+                    model_name,
+                    model,
+                    fold_id,
+                    train_index,
+                    test_index,
+                    sample_id,
+                    sample_random_state,
+                    sample_index,
+                    sampling_strategy,
+                    calibration_model,
+                    model_building,
+                    dump_params if model_building else None,
+                )
+            )
+            + ".pkl",
+        )
+        if os.path.exists(cache_path):
+            with open(cache_path, "rb") as f:
+                return pickle.load(f)
+
+    model = clone(model)
+
+    X_test, y_test = X[test_index], y[test_index]
+    if sample_index is None:
+        X_sample, y_sample = sample(
+            X[train_index],
+            y[train_index],
+            strategy=sampling_strategy,
+            random_state=sample_random_state,
+        )
+    else:
+        X_sample, y_sample = X[sample_index], y[sample_index]
+
+    if calibration_model is not None:
+        calibration_model = clone(calibration_model)
+        calibration_model.base_estimator = model
+        model = calibration_model
+
+    model.fit(X_sample, y_sample)
+
+    if model_building:
+        results_dict = {
+            "model name": model_name,
+            "sample id": sample_id,
+            "pickled model": dump_model(
+                model, **(dump_params or {})
+            ),  # pickle model to reduce memory usage. use utils.load_model() to de-serialize
+        }
+
+    else:
+        y_pred = safe_predict_proba(model, X_test)
+
+        results_dict = {
+            "model name": model_name,
+            "sample id": sample_id,
+            "fold id": fold_id,
+            "y_pred": y_pred,
+            "labels": y_test,
+        }
+
+    if cache_dir is not None:
+        _atomic_pickle(results_dict, cache_path)
+
+    return results_dict
+
+
+def _atomic_pickle(obj, path):
+    """
+    Pickle obj to a temporary file next to path and move it into place, so an
+    interrupted write never leaves a partial file at path.
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(obj, f)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def _run_keyed_task(key, func, args, kwargs):
+    """
+    Run a joblib delayed task and return its result with a key identifying
+    where it belongs.
+    """
+    return key, func(*args, **kwargs)
+
+
+@ignore_warnings(category=ConvergenceWarning)
+def _fit_predict_meta_predictor(model, X_train, y_train, X_test):
+    """
+    Fit a meta predictor on one outer training fold and predict its test fold.
+    """
+    model.fit(X_train, y_train)
+    return safe_predict_proba(model, X_test)
+
+
+@ignore_warnings(category=ConvergenceWarning)
+def _fit_meta_predictor(model, X_train, y_train, dump_params=None):
+    """
+    Fit a final meta predictor and return it serialized with dump_model.
+    """
+    model.fit(X_train, y_train)
+    return dump_model(model, **(dump_params or {}))
+
+
 class EnsembleIntegration:
     """
     Ensemble Integration.
@@ -67,6 +219,32 @@ class EnsembleIntegration:
         Random state for cross-validation and use in some models.
     parallel_backend : str, default='loky'
         Backend to use in joblib. See joblib.Parallel() for other options.
+    scheduling : str, default='phased'
+        How train_base schedules base predictor fits. 'phased' runs the inner
+        folds of each outer fold, the outer folds and the final models as
+        separate batches, waiting for each to finish. 'global' submits every fit
+        of a modality to one task pool and assembles results as they complete,
+        which keeps workers busy when fit times are uneven.
+    memmap_folder : str, default=None
+        Folder in which each modality matrix is dumped once during train_base
+        and memory-mapped read-only. joblib tasks then receive a reference to
+        the file and fold indices instead of copies of the matrix. The dump is
+        removed once training on the modality finishes. If None, joblib's
+        automatic memmapping of large arrays applies.
+    cache_dir : str, default=None
+        Folder in which the result of every base predictor fit is stored as
+        soon as it finishes, keyed by a hash of the estimator parameters,
+        modality data, fold indices, sample random state and sampling
+        strategy. Re-running train_base after an interruption loads finished
+        fits from the folder and only computes the missing ones.
+    model_compression : str, default=None
+        Compression of the final models kept in final_models: 'zlib', 'lzma'
+        or 'zstd' (requires the zstandard package). If None, models are stored
+        as uncompressed pickles.
+    compression_level : int, default=None
+        Compression level. If None, the default level of the compressor.
+    pickle_protocol : int, default=None
+        Pickle protocol of the final models. If None, pickle.DEFAULT_PROTOCOL.
     project_name : str, default='project'
         Name of project.
     calibration_model : sklearn estimator, default=None
@@ -74,6 +252,11 @@ class EnsembleIntegration:
         with sklearn's CalibratedClassifierCV().
     model_building : bool, default=False
         Whether or not to train and save final models.
+    n_bootstrap : int, default=None
+        Number of bootstrap resamples used to estimate confidence intervals of
+        the scores in base_summary and meta_summary. No intervals if None.
+    ci_level : float, default=0.95
+        Confidence level of the bootstrap intervals.
     verbose : int, default=1
         Verbosity level. Can be set to 0 or 1.
 
@@ -82,16 +265,24 @@ class EnsembleIntegration:
     base_summary : dict
         Summary of performance scores for each base predictor. Scores can be accessed
         using the 'metrics' key and corresponding thresholds (if applicable) can be
-        accessed in the 'thresholds' key.
+        accessed in the 'thresholds' key. If n_bootstrap is set, confidence bounds
+        are accessed in the 'lower' and 'upper' keys.
     meta_summary : dict
         Summary of performance scores for each ensemble method. Scores can be accessed
         using the 'metrics' key and corresponding thresholds (if applicable) can be
-        accessed in the 'thresholds' key.
+        accessed in the 'thresholds' key. If n_bootstrap is set, confidence bounds
+        are accessed in the 'lower' and 'upper' keys.
     meta_training_data : list of pandas.DataFrame
         Training data for ensemble methods, for each outer fold.
-        len(meta_training_data) = len(k_outer)
+        len(meta_training_data) = len(k_outer). Built on demand from
+        meta_training_store.
     meta_test_data : list of pandas.DataFrame
         Test data for ensemble methods, for each outer fold. len(meta_test_data) = len(k_outer)
+        Built on demand from meta_test_store.
+    meta_training_store : MetaDataStore
+        Columnar store of the meta training data.
+    meta_test_store : MetaDataStore
+        Columnar store of the meta test data.
     meta_predictions : pandas.DataFrame
         Combined predictions (across all outer folds) made by each ensemble method.
     modality_names : list of str
@@ -105,11 +296,18 @@ class EnsembleIntegration:
         Populated if model_building=True.
     meta_training_data_final: list of pandas.DataFrame
         List containing single dataframe of training data. Final models are
-        trained on all available data.
+        trained on all available data. Built on demand from
+        meta_training_store_final.
+    meta_training_store_final : MetaDataStore
+        Columnar store of the final meta training data.
     cv_outer : StratifiedKFold
         StratifiedKFold() cross validator from sklearn.
     cv_inner : StratifiedKFold
         StratifiedKFold() cross validator from sklearn.
+    fold_plan : FoldPlan
+        Outer and inner fold indices computed from cv_outer and cv_inner on the
+        first call to train_base, reused for every modality and saved with the
+        object.
 
     """
 
@@ -125,13 +323,26 @@ class EnsembleIntegration:
         n_jobs=1,
         random_state=None,
         parallel_backend="loky",
+        scheduling="phased",
+        memmap_folder=None,
+        cache_dir=None,
+        model_compression=None,
+        compression_level=None,
+        pickle_protocol=None,
         project_name="project",
         calibration_model=None,
         model_building=False,
+        n_bootstrap=None,
+        ci_level=0.95,
         verbose=1,
     ):
         set_seed(random_state)
 
+        if scheduling not in ("phased", "global"):
+            raise ValueError(
+                f"Unknown scheduling {scheduling!r}. Use 'phased' or 'global'."
+            )
+
         self.base_predictors = base_predictors
         self.meta_predictors = meta_predictors
         self.k_outer = k_outer
@@ -142,13 +353,21 @@ class EnsembleIntegration:
         self.n_jobs = n_jobs
         self.random_state = random_state
         self.parallel_backend = parallel_backend
+        self.scheduling = scheduling
+        self.memmap_folder = memmap_folder
+        self.cache_dir = cache_dir
+        self.model_compression = model_compression
+        self.compression_level = compression_level
+        self.pickle_protocol = pickle_protocol
         self.project_name = project_name
         self.calibration_model = calibration_model
         self.model_building = model_building
+        self.n_bootstrap = n_bootstrap
+        self.ci_level = ci_level
         self.verbose = verbose
 
         self.final_models = {"base models": {}, "meta models": {}}  # for final model
-        self.meta_training_data_final = None  # for final model
+        self.meta_training_store_final = None  # for final model
 
         self.cv_outer = StratifiedKFold(
             n_splits=self.k_outer, shuffle=True, random_state=self.random_state
@@ -158,8 +377,12 @@ class EnsembleIntegration:
             n_splits=self.k_inner, shuffle=True, random_state=self.random_state
         )
 
-        self.meta_training_data = None
-        self.meta_test_data = None
+        self.fold_plan = None  # computed from y by the first call to train_base
+        self._data_key = None
+        self._predictor = None  # compiled final models, see _compiled_predictor
+
+        self.meta_training_store = None
+        self.meta_test_store = None
         self.base_summary = None
 
         self.meta_predictions = None
@@ -173,6 +396,70 @@ class EnsembleIntegration:
         )
         self.feature_names_dict = {}
 
+    @property
+    def meta_training_data(self):
+        if self.meta_training_store is None:
+            return None
+        return self.meta_training_store.frames()
+
+    @meta_training_data.setter
+    def meta_training_data(self, frames):
+        self.meta_training_store = MetaDataStore.from_frames(frames)
+
+    @property
+    def meta_test_data(self):
+        if self.meta_test_store is None:
+            return None
+        return self.meta_test_store.frames()
+
+    @meta_test_data.setter
+    def meta_test_data(self, frames):
+        self.meta_test_store = MetaDataStore.from_frames(frames)
+
+    @property
+    def meta_training_data_final(self):
+        if self.meta_training_store_final is None:
+            return None
+        return self.meta_training_store_final.frames()
+
+    @meta_training_data_final.setter
+    def meta_training_data_final(self, frames):
+        self.meta_training_store_final = MetaDataStore.from_frames(frames)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_predictor"] = None
+        return state
+
+    def __setstate__(self, state):
+        # objects saved before MetaDataStore held meta data as DataFrames
+        for name in [
+            "meta_training_data",
+            "meta_test_data",
+            "meta_training_data_final",
+        ]:
+            if name in state:
+                frames = state.pop(name)
+                store_name = name.replace("_data", "_store")
+                state[store_name] = MetaDataStore.from_frames(frames)
+        # attributes added since, with their __init__ defaults
+        defaults = {
+            "scheduling": "phased",
+            "memmap_folder": None,
+            "cache_dir": None,
+            "model_compression": None,
+            "compression_level": None,
+            "pickle_protocol": None,
+            "n_bootstrap": None,
+            "ci_level": 0.95,
+            "fold_plan": None,
+            "_data_key": None,
+            "_predictor": None,
+        }
+        for name, default in defaults.items():
+            state.setdefault(name, default)
+        self.__dict__.update(state)
+
     @ignore_warnings(category=ConvergenceWarning)
     def train_base(self, X, y, base_predictors=None, modality=None):
         """
@@ -198,52 +485,141 @@ class EnsembleIntegration:
                 for ensemble performance analysis..."
         )
 
-        X_np, feature_names = format_input_datatype(X, modality_name=modality)
+        X_np, feature_names = self._prepare_modality(X, y, modality)
+        self._predictor = None
         self.modality_names.append(modality)
         self.feature_names_dict[modality] = feature_names
         self.n_features_per_modality.append(X_np.shape[1])
 
         if base_predictors is not None:
             self.base_predictors = base_predictors  # update base predictors
-        
-        for _, v in self.base_predictors.items():
-            if type(v) == Pipeline:
-                est_ = list(v.named_steps)[-1]
-                if hasattr(v[est_], "random_state") and hasattr(v[est_], "set_params"):
-                    v.set_params(**{"{}__random_state".format(est_): self.random_state})
-            if hasattr(v, "random_state") and hasattr(v, "set_params"):
-                v.set_params(**{"random_state": self.random_state})
 
-        meta_training_data_modality = self._train_base_inner(
-            X=X_np,
-            y=y,
-            cv_outer=self.cv_outer,
-            cv_inner=self.cv_inner,
-            base_predictors=self.base_predictors,
-            modality=modality,
+        self._set_random_states(self.base_predictors)
+
+        (
+            meta_training_data_modality,
+            meta_test_data_modality,
+            final_training_data_modality,
+            final_base_models,
+        ) = self._fit_modality(X_np, y, modality)
+
+        self.meta_training_store = self._add_to_store(
+            self.meta_training_store, meta_training_data_modality, modality
         )
 
-        self.meta_training_data = append_modality(
-            self.meta_training_data, meta_training_data_modality
+        self.meta_test_store = self._add_to_store(
+            self.meta_test_store, meta_test_data_modality, modality
         )
 
-        meta_test_data_modality = self._train_base_outer(
-            X=X_np,
-            y=y,
-            cv_outer=self.cv_outer,
-            base_predictors=self.base_predictors,
-            modality=modality,
+        # create a summary of base predictor performance
+        self.base_summary = create_base_summary(
+            self.meta_test_store,
+            n_jobs=self.n_jobs,
+            n_bootstrap=self.n_bootstrap,
+            ci_level=self.ci_level,
+            random_state=self.random_state,
         )
 
-        self.meta_test_data = append_modality(
-            self.meta_test_data, meta_test_data_modality
-        )  # append data to dataframe
+        if self.model_building:
+            self.meta_training_store_final = self._add_to_store(
+                self.meta_training_store_final, final_training_data_modality, modality
+            )
+            self.final_models["base models"][modality] = final_base_models
 
-        # create a summary of base predictor performance
-        self.base_summary = create_base_summary(self.meta_test_data)
+        print("\n")
+
+        return self
+
+    @ignore_warnings(category=ConvergenceWarning)
+    def add_base_predictors(self, X, y, base_predictors, modality):
+        """
+        Train additional base predictors on a modality already seen by
+        train_base, reusing its outer and inner cross validation splits.
+
+        Predictions of the new base predictors are added to the meta
+        training/test data of the modality, fitted final models are added to
+        final_models and base_summary is extended with the new columns.
+        Base predictors already trained are not refitted. Run train_meta
+        afterwards to use the new base predictors in the ensembles.
+
+        Parameters
+        ----------
+        X : array of shape (n_samples, n_features)
+            Training vector of the modality, as passed to train_base.
+        y : array of shape (n_samples,)
+            Target vector relative to X.
+        base_predictors : dict
+            Dictionary of (sklearn-like) base predictors to add.
+        modality : str
+            Name of the modality.
+
+        Returns
+        -------
+        self
+            Extended meta train/test data and fitted final base predictors.
+        """
+
+        if modality not in self.modality_names:
+            raise ValueError(f"{modality} has not been trained with train_base.")
+
+        existing = set(self.meta_test_store.base_predictors[modality])
+        duplicates = existing.intersection(base_predictors)
+        if duplicates:
+            raise ValueError(
+                f"Base predictors {sorted(duplicates)} are already trained on"
+                f" {modality}."
+            )
+
+        print(f"Training additional base predictors on {modality}...")
+
+        X_np, _ = self._prepare_modality(X, y, modality)
+        self._predictor = None
+
+        # fit only the new base predictors, restoring the previous ones after
+        previous_base_predictors = self.base_predictors
+        self.base_predictors = base_predictors
+        self._set_random_states(self.base_predictors)
+        try:
+            (
+                meta_training_data_modality,
+                meta_test_data_modality,
+                final_training_data_modality,
+                final_base_models,
+            ) = self._fit_modality(X_np, y, modality)
+        finally:
+            self.base_predictors = previous_base_predictors
+
+        names = list(base_predictors)
+        for store, fold_predictions in [
+            (self.meta_training_store, meta_training_data_modality),
+            (self.meta_test_store, meta_test_data_modality),
+            (self.meta_training_store_final, final_training_data_modality),
+        ]:
+            if fold_predictions is not None:
+                store.add_base_predictors(
+                    modality, names, [predictions for predictions, *_ in fold_predictions]
+                )
+
+        # summarise only the new columns and append them to base_summary
+        new_columns = self._add_to_store(
+            None, meta_test_data_modality, modality, base_predictors=names
+        )
+        new_summary = create_base_summary(
+            new_columns,
+            n_jobs=self.n_jobs,
+            n_bootstrap=self.n_bootstrap,
+            ci_level=self.ci_level,
+            random_state=self.random_state,
+        )
+        self.base_summary = {
+            key: pd.concat([summary, new_summary[key]], axis=1)
+            for key, summary in self.base_summary.items()
+        }
 
         if self.model_building:
-            self._train_base_final(X=X_np, y=y, modality=modality)
+            self.final_models["base models"][modality] = (
+                self.final_models["base models"][modality] + final_base_models
+            )
 
         print("\n")
 
@@ -267,6 +643,7 @@ class EnsembleIntegration:
 
         if meta_predictors is not None:
             self.meta_predictors = meta_predictors
+        self._predictor = None
 
         for _, v in self.meta_predictors.items():
             if type(v) == Pipeline:
@@ -276,63 +653,70 @@ class EnsembleIntegration:
             if hasattr(v, "random_state"):
                 v.set_params(**{"random_state": self.random_state})
 
-        y_test_combined = []
+        aggregate = self.sampling_aggregation == "mean"
 
-        for fold_id in range(self.k_outer):
-            _, y_test = retrieve_X_y(labelled_data=self.meta_test_data[fold_id])
-            y_test_combined.extend(y_test)
+        y_test_combined = np.concatenate(
+            [self.meta_test_store.labels[fold_id] for fold_id in range(self.k_outer)]
+        )
 
-        meta_predictions = {}
-        performance_metrics = []
-
-        for model_name, model in tqdm(
-            self.meta_predictors.items(),
-            desc="Analyzing ensembles",
-            bar_format=bar_format,
-        ):
-            y_pred_combined = []
-
-            for fold_id in range(self.k_outer):
-                X_train, y_train = retrieve_X_y(
-                    labelled_data=self.meta_training_data[fold_id]
+        # fit every (meta predictor, outer fold) pair in parallel
+        with Parallel(
+            n_jobs=self.n_jobs, verbose=0, backend=self.parallel_backend
+        ) as parallel:
+            output = parallel(
+                delayed(_fit_predict_meta_predictor)(
+                    model=clone(model),
+                    X_train=self.meta_training_store.X(fold_id, aggregate=aggregate),
+                    y_train=self.meta_training_store.labels[fold_id],
+                    X_test=self.meta_test_store.X(fold_id, aggregate=aggregate),
                 )
-                X_test, _ = retrieve_X_y(labelled_data=self.meta_test_data[fold_id])
-
-                if self.sampling_aggregation == "mean":
-                    X_train = X_train.groupby(level=[0, 1], axis=1).mean()
-                    X_test = X_test.groupby(level=[0, 1], axis=1).mean()
-
-                model.fit(X_train, y_train)
-                y_pred = safe_predict_proba(model, X_test)
-                y_pred_combined.extend(y_pred)
-
-            meta_predictions[model_name] = y_pred_combined
-            performance_metrics.append(
-                scores(y_test_combined, y_pred_combined, verbose=0)
+                for model in tqdm(
+                    self.meta_predictors.values(),
+                    desc="Analyzing ensembles",
+                    bar_format=bar_format,
+                )
+                for fold_id in range(self.k_outer)
             )
 
+        meta_predictions = {}
+        for i, model_name in enumerate(self.meta_predictors):
+            meta_predictions[model_name] = np.concatenate(
+                output[i * self.k_outer : (i + 1) * self.k_outer]
+            )
         meta_predictions["labels"] = y_test_combined
 
         self.meta_predictions = pd.DataFrame.from_dict(meta_predictions)
-        self.meta_summary = metric_threshold_dataframes(self.meta_predictions)
+        self.meta_summary = metric_threshold_dataframes(
+            self.meta_predictions,
+            n_jobs=self.n_jobs,
+            n_bootstrap=self.n_bootstrap,
+            ci_level=self.ci_level,
+            random_state=self.random_state,
+        )
 
         if self.model_building:
-            for model_name, model in tqdm(
-                self.meta_predictors.items(),
-                desc="Training final meta models",
-                bar_format=bar_format,
-            ):
-                X_train, y_train = retrieve_X_y(
-                    labelled_data=self.meta_training_data_final[0]
-                )
-
-                if self.sampling_aggregation == "mean":
-                    X_train = X_train.groupby(level=[0, 1], axis=1).mean()
-                    X_test = X_test.groupby(level=[0, 1], axis=1).mean()
+            X_train = self.meta_training_store_final.X(0, aggregate=aggregate)
+            y_train = self.meta_training_store_final.labels[0]
 
-                model.fit(X_train, y_train)
+            with Parallel(
+                n_jobs=self.n_jobs, verbose=0, backend=self.parallel_backend
+            ) as parallel:
+                output = parallel(
+                    delayed(_fit_meta_predictor)(
+                        model=clone(model),
+                        X_train=X_train,
+                        y_train=y_train,
+                        dump_params=self._dump_params(),
+                    )
+                    for model in tqdm(
+                        self.meta_predictors.values(),
+                        desc="Training final meta models",
+                        bar_format=bar_format,
+                    )
+                )
 
-                self.final_models["meta models"][model_name] = pickle.dumps(model)
+            for model_name, pickled_model in zip(self.meta_predictors, output):
+                self.final_models["meta models"][model_name] = pickled_model
 
         return self
 
@@ -354,45 +738,185 @@ class EnsembleIntegration:
             Vector containing the class labels for each sample.
         """
 
-        # TODO: follow the order of feature?
+        return self._compiled_predictor().predict(X_dict, meta_model_key)
 
-        meta_prediction_data = None
+    def predict_chunks(self, X_dict, meta_model_key, chunk_size=10000):
+        """
+        Predict in row chunks, for data larger than memory.
 
-        for i in range(len(self.modality_names)):
-            modality_name = self.modality_names[i]
-            n_features = self.n_features_per_modality[i]
-            X = X_dict[modality_name]
+        Parameters
+        ----------
+        X_dict : dict
+            Dictionary of X modalities. Values are either arrays (including
+            numpy memory maps), sliced into chunks of chunk_size rows, or
+            iterables yielding matching row chunks of each modality.
+        meta_model_key :
+            The key of the ensemble method selected during performance analysis.
+        chunk_size : int, default=10000
+            Number of rows per chunk, for array inputs.
 
-            # check number of features is the same
-            assert X.shape[1] == n_features, (
-                f"{X.shape[1]} features were given for {modality_name} modality, but"
-                f" {n_features} were used during training."
-            )
+        Yields
+        ------
+        y_pred : array
+            Predictions of each chunk.
+        """
 
-            base_models = copy.deepcopy(self.final_models["base models"][modality_name])
-            for base_model_dict in base_models:
-                base_model = pickle.loads(base_model_dict["pickled model"])
-                y_pred = safe_predict_proba(base_model, X)
+        yield from self._compiled_predictor().predict_chunks(
+            X_dict, meta_model_key, chunk_size=chunk_size
+        )
 
-                base_model_dict["fold id"] = 0
-                base_model_dict["y_pred"] = y_pred
+    def compile(self, meta_model_keys=None, n_jobs=1):
+        """
+        Build a predictor holding the deserialized final models, for repeated
+        predictions without reloading models. Meta models are deserialized
+        when first used.
 
-            combined_predictions = self._combine_predictions_outer(
-                base_models, modality_name, model_building=True
-            )
-            meta_prediction_data = append_modality(
-                meta_prediction_data, combined_predictions, model_building=True
-            )
+        Parameters
+        ----------
+        meta_model_keys : list of str, default=None
+            Keys of the final meta models to use. If None, all are used.
+        n_jobs : int, default=1
+            Number of threads running base models.
+
+        Returns
+        -------
+        predictor : CompiledPredictor
+            Predictor with predict(X_dict, meta_model_keys) and
+            predict_base(X_dict) methods.
+        """
+
+        return CompiledPredictor(self, meta_model_keys=meta_model_keys, n_jobs=n_jobs)
+
+    def _compiled_predictor(self):
+        """
+        Predictor of all final models used by predict and predict_chunks.
+        Base models are deserialized on the first prediction and meta models
+        on the first prediction with their key, and reused until train_base,
+        add_base_predictors or train_meta change them.
+        """
+
+        if self._predictor is None:
+            self._predictor = self.compile(n_jobs=self.n_jobs)
+        return self._predictor
+
+    def final_model_sizes(self):
+        """
+        Size of each final model as stored in final_models.
+
+        Returns
+        -------
+        sizes : pandas.DataFrame
+            Bytes held by each base model (by modality, base predictor and
+            sample) and meta model.
+        """
 
-        if self.sampling_aggregation == "mean":
-            meta_prediction_data = (
-                meta_prediction_data[0].groupby(level=[0, 1], axis=1).mean()
+        rows = [
+            (
+                "base",
+                modality,
+                d["model name"],
+                d["sample id"],
+                model_size(d["pickled model"]),
             )
+            for modality, models in self.final_models["base models"].items()
+            for d in models
+        ]
+        rows += [
+            ("meta", None, model_name, None, model_size(model))
+            for model_name, model in self.final_models["meta models"].items()
+        ]
+        return pd.DataFrame(
+            rows, columns=["kind", "modality", "model name", "sample id", "bytes"]
+        )
+
+    def _dump_params(self):
+        """
+        Serialization parameters of final models, for utils.dump_model.
+        """
+
+        return {
+            "compression": self.model_compression,
+            "level": self.compression_level,
+            "protocol": self.pickle_protocol,
+        }
+
+    def _set_random_states(self, base_predictors):
+        """
+        Set the random state of base predictors (and of the final step of
+        pipelines) to that of the EnsembleIntegration object.
+        """
+
+        for _, v in base_predictors.items():
+            if type(v) == Pipeline:
+                est_ = list(v.named_steps)[-1]
+                if hasattr(v[est_], "random_state") and hasattr(v[est_], "set_params"):
+                    v.set_params(**{"{}__random_state".format(est_): self.random_state})
+            if hasattr(v, "random_state") and hasattr(v, "set_params"):
+                v.set_params(**{"random_state": self.random_state})
+
+    def _fit_modality(self, X, y, modality):
+        """
+        Fit self.base_predictors on a modality, returning meta training and
+        meta test data, and final model meta training data and base models
+        (None unless model_building).
+        """
 
-        meta_model = pickle.loads(self.final_models["meta models"][meta_model_key])
+        if self.fold_plan is None:
+            self.fold_plan = FoldPlan.from_cv(y, self.cv_outer, self.cv_inner)
+        else:
+            self.fold_plan.check(y)
+
+        try:
+            return self._fit_modality_splits(X, y, modality)
+        finally:
+            self.fold_plan.clear_samples()
+
+    def _fit_modality_splits(self, X, y, modality):
+        """
+        Fit self.base_predictors on the splits of the fold plan.
+        """
 
-        y_pred = safe_predict_proba(meta_model, meta_prediction_data)
-        return y_pred
+        if self.scheduling == "global":
+            return self._train_base_global(X=X, y=y)
+
+        meta_training_data_modality = self._train_base_inner(
+            X=X,
+            y=y,
+            inner_splits=self.fold_plan.inner,
+            base_predictors=self.base_predictors,
+            modality=modality,
+        )
+        meta_test_data_modality = self._train_base_outer(
+            X=X,
+            y=y,
+            outer_splits=self.fold_plan.outer,
+            base_predictors=self.base_predictors,
+            modality=modality,
+        )
+
+        if not self.model_building:
+            return meta_training_data_modality, meta_test_data_modality, None, None
+
+        return (
+            meta_training_data_modality,
+            meta_test_data_modality,
+            *self._train_base_final(X=X, y=y, modality=modality),
+        )
+
+    def _prepare_modality(self, X, y, modality):
+        """
+        Format the data of a modality for training, set the data key of the
+        result cache and memmap the data if requested.
+        """
+
+        X_np, feature_names = format_input_datatype(X, modality_name=modality)
+        self._data_key = None
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._data_key = joblib.hash((X_np, y))
+        if self.memmap_folder is not None:
+            X_np = self._memmap_modality(X_np)
+        return X_np, feature_names
 
     def _train_base_final(self, X, y, modality=None):
         """
@@ -403,29 +927,209 @@ class EnsembleIntegration:
         meta_training_data_modality = self._train_base_inner(
             X=X,
             y=y,
-            cv_inner=self.cv_inner,
-            cv_outer=dummy_cv(),  # returns indices of X with an empty set of test indices
+            inner_splits=[self.fold_plan.final_inner],
+            split_name="final inner",
             base_predictors=self.base_predictors,
             modality=modality,
         )
 
-        self.meta_training_data_final = append_modality(
-            self.meta_training_data_final, meta_training_data_modality
-        )
-
         base_model_list_of_dicts = self._train_base_outer(
             X=X,
             y=y,
-            cv_outer=dummy_cv(),  # returns indices of X with an empty set of test indices
+            outer_splits=self.fold_plan.final,
+            split_name="final",
             base_predictors=self.base_predictors,
             modality=modality,
             model_building=self.model_building,
         )
 
-        self.final_models["base models"][modality] = base_model_list_of_dicts
+        return meta_training_data_modality, base_model_list_of_dicts
+
+    def _memmap_modality(self, X):
+        """
+        Dump a modality matrix to memmap_folder and load it read-only. The file
+        is removed when the memory map is garbage collected.
+        """
+
+        if self.memmap_folder is not None:
+            os.makedirs(self.memmap_folder, exist_ok=True)
+        folder = tempfile.mkdtemp(prefix="eipy_", dir=self.memmap_folder)
+        filename = os.path.join(folder, "X.mmap")
+        joblib.dump(np.ascontiguousarray(X), filename)
+        X_mmap = joblib.load(filename, mmap_mode="r")
+        weakref.finalize(X_mmap, shutil.rmtree, folder, True)
+        return X_mmap
+
+    def _train_base_global(self, X, y):
+        """
+        Train base predictors with every fit of the modality (inner folds of all
+        outer folds, outer folds and final models) submitted to one joblib task
+        pool, assembling results as they complete.
+        """
+
+        plan = self.fold_plan
+
+        n_fits = len(self.base_predictors) * self.n_samples
+        n_tasks = n_fits * (self.k_outer * self.k_inner + self.k_outer)
+        if self.model_building:
+            n_tasks += n_fits * (self.k_inner + 1)
+
+        results = {}
+        with Parallel(
+            n_jobs=self.n_jobs,
+            verbose=0,
+            backend=self.parallel_backend,
+            return_as="generator_unordered",
+        ) as parallel:
+            for key, result in tqdm(
+                parallel(
+                    delayed(_run_keyed_task)(key, *task)
+                    for key, task in self._global_tasks(X, y)
+                ),
+                total=n_tasks,
+                desc="Training base predictors",
+                bar_format=bar_format,
+            ):
+                results.setdefault(key, []).append(result)
+
+        meta_training_data_modality = []
+        for outer_fold_id, inner_splits in enumerate(plan.inner):
+            predictions, labels = self._combine_predictions_inner(
+                results["inner", outer_fold_id]
+            )
+            row_indices = plan.row_indices(inner_splits)
+            meta_training_data_modality.append((predictions, labels, row_indices))
+
+        meta_test_data_modality = [
+            (predictions, labels, test_index)
+            for (predictions, labels), (_, test_index) in zip(
+                self._combine_predictions_outer(results["outer", 0]), plan.outer
+            )
+        ]
+
+        if not self.model_building:
+            return meta_training_data_modality, meta_test_data_modality, None, None
+
+        predictions, labels = self._combine_predictions_inner(results["final inner", 0])
+        row_indices = plan.row_indices(plan.final_inner)
+        final_training_data_modality = [(predictions, labels, row_indices)]
+
+        # same order as phased training: by base predictor, then sample
+        model_index = {name: i for i, name in enumerate(self.base_predictors)}
+        final_base_models = sorted(
+            results["final", 0],
+            key=lambda d: (model_index[d["model name"]], d["sample id"]),
+        )
+
+        return (
+            meta_training_data_modality,
+            meta_test_data_modality,
+            final_training_data_modality,
+            final_base_models,
+        )
+
+    def _global_tasks(self, X, y):
+        """
+        Generate (key, task) pairs for _train_base_global.
+        """
+
+        plan = self.fold_plan
+
+        for outer_fold_id, inner_splits in enumerate(plan.inner):
+            for task in self._inner_fold_tasks(
+                X, y, inner_splits, ("inner", outer_fold_id)
+            ):
+                yield ("inner", outer_fold_id), task
+
+        for task in self._outer_tasks(X, y, plan.outer, "outer"):
+            yield ("outer", 0), task
+
+        if self.model_building:
+            for task in self._inner_fold_tasks(
+                X, y, plan.final_inner, ("final inner", 0)
+            ):
+                yield ("final inner", 0), task
+            for task in self._outer_tasks(
+                X, y, plan.final, "final", model_building=True
+            ):
+                yield ("final", 0), task
+
+    def _inner_fold_tasks(self, X, y, inner_splits, split_name):
+        """
+        Tasks for each base predictor, inner fold and sample of an outer
+        training set. Inner split indices refer to rows of X, so tasks receive
+        the full modality matrix rather than a copy of the outer training set.
+        """
+
+        return (
+            delayed(_train_predict_single_base_predictor)(
+                X=X,
+                y=y,
+                model_params=model_params,
+                fold_params=inner_fold_params,
+                sample_state=sample_state,
+                sampling_strategy=self.sampling_strategy,
+                calibration_model=self.calibration_model,
+                cache_dir=self.cache_dir,
+                data_key=self._data_key,
+                sample_index=self._sample_index(
+                    split_name, inner_fold_params, sample_state
+                ),
+            )
+            for model_params in self.base_predictors.items()
+            for inner_fold_params in enumerate(inner_splits)
+            for sample_state in enumerate(self.random_numbers_for_samples)
+        )
+
+    def _outer_tasks(
+        self, X, y, outer_splits, split_name, model_building=False, model_items=None
+    ):
+        """
+        Tasks for each base predictor, outer fold and sample.
+        """
+
+        if model_items is None:
+            model_items = self.base_predictors.items()
+
+        return (
+            delayed(_train_predict_single_base_predictor)(
+                X=X,
+                y=y,
+                model_params=model_params,
+                fold_params=outer_fold_params,
+                sample_state=sample_state,
+                sampling_strategy=self.sampling_strategy,
+                calibration_model=self.calibration_model,
+                cache_dir=self.cache_dir,
+                data_key=self._data_key,
+                sample_index=self._sample_index(
+                    split_name, outer_fold_params, sample_state
+                ),
+                model_building=model_building,
+                dump_params=self._dump_params(),
+            )
+            for model_params in model_items
+            for outer_fold_params in enumerate(outer_splits)
+            for sample_state in enumerate(self.random_numbers_for_samples)
+        )
+
+    def _sample_index(self, split_name, fold_params, sample_state):
+        """
+        Precomputed class-balanced sample of a training fold, shared by all
+        base predictors.
+        """
+
+        fold_id, (train_index, _) = fold_params
+        sample_id, _ = sample_state
+        return self.fold_plan.samples(
+            (split_name, fold_id),
+            train_index,
+            self.sampling_strategy,
+            self.random_numbers_for_samples,
+        )[sample_id]
 
     def _train_base_inner(
-        self, X, y, cv_outer, cv_inner, base_predictors=None, modality=None
+        self, X, y, inner_splits, split_name="inner", base_predictors=None, modality=None
     ):
         """
         Perform a round of (inner) k-fold cross validation on each outer
@@ -442,40 +1146,35 @@ class EnsembleIntegration:
         with Parallel(
             n_jobs=self.n_jobs, verbose=0, backend=self.parallel_backend
         ) as parallel:
-            for _outer_fold_id, (train_index_outer, _test_index_outer) in enumerate(
+            for outer_fold_id, inner_splits_outer_fold in enumerate(
                 tqdm(
-                    cv_outer.split(X, y),
-                    total=cv_outer.n_splits,
+                    inner_splits,
                     desc="Generating meta training data",
                     bar_format=bar_format,
                 )
             ):
-                X_train_outer = X[train_index_outer]
-                y_train_outer = y[train_index_outer]
-
                 # spawn n_jobs jobs for each sample, inner_fold and model
                 output = parallel(
-                    delayed(self._train_predict_single_base_predictor)(
-                        X=X_train_outer,
-                        y=y_train_outer,
-                        model_params=model_params,
-                        fold_params=inner_fold_params,
-                        sample_state=sample_state,
+                    self._inner_fold_tasks(
+                        X, y, inner_splits_outer_fold, (split_name, outer_fold_id)
                     )
-                    for model_params in self.base_predictors.items()
-                    for inner_fold_params in enumerate(
-                        cv_inner.split(X_train_outer, y_train_outer)
-                    )
-                    for sample_state in enumerate(self.random_numbers_for_samples)
                 )
 
-                combined_predictions = self._combine_predictions_inner(output, modality)
-                meta_training_data_modality.append(combined_predictions)
+                row_indices = FoldPlan.row_indices(inner_splits_outer_fold)
+                predictions, labels = self._combine_predictions_inner(output)
+                meta_training_data_modality.append((predictions, labels, row_indices))
 
         return meta_training_data_modality
 
     def _train_base_outer(
-        self, X, y, cv_outer, base_predictors=None, modality=None, model_building=False
+        self,
+        X,
+        y,
+        outer_splits,
+        split_name="outer",
+        base_predictors=None,
+        modality=None,
+        model_building=False,
     ):
         """
         Train each base predictor on each outer training set.
@@ -495,118 +1194,61 @@ class EnsembleIntegration:
         ) as parallel:
             # spawn job for each sample, outer_fold and model
             output = parallel(
-                delayed(self._train_predict_single_base_predictor)(
-                    X=X,
-                    y=y,
-                    model_params=model_params,
-                    fold_params=outer_fold_params,
-                    sample_state=sample_state,
+                self._outer_tasks(
+                    X,
+                    y,
+                    outer_splits,
+                    split_name,
                     model_building=model_building,
+                    model_items=tqdm(
+                        self.base_predictors.items(),
+                        desc=progress_string,
+                        bar_format=bar_format,
+                    ),
                 )
-                for model_params in tqdm(
-                    self.base_predictors.items(),
-                    desc=progress_string,
-                    bar_format=bar_format,
-                )
-                for outer_fold_params in enumerate(cv_outer.split(X, y))
-                for sample_state in enumerate(self.random_numbers_for_samples)
             )
 
         if model_building:
             return output
         else:
-            return self._combine_predictions_outer(output, modality)
+            return [
+                (predictions, labels, test_index)
+                for (predictions, labels), (_, test_index) in zip(
+                    self._combine_predictions_outer(output), outer_splits
+                )
+            ]
 
-    @ignore_warnings(category=ConvergenceWarning)
-    def _train_predict_single_base_predictor(
-        self, X, y, model_params, fold_params, sample_state, model_building=False
-    ):
+    def _combine_predictions_inner(self, list_of_dicts):
         """
-        Train/test single base predictor, on a given training fold,
-        subject to a given sampling strategy.
+        Combine the predictions arising from the inner cross validation.
         """
 
-        model_name, model = model_params
-
-        model = clone(model)
-
-        fold_id, (train_index, test_index) = fold_params
-        sample_id, sample_random_state = sample_state
-
-        X_train, X_test = X[train_index], X[test_index]
-        y_train, y_test = y[train_index], y[test_index]
-        X_sample, y_sample = sample(
-            X_train,
-            y_train,
-            strategy=self.sampling_strategy,
-            random_state=sample_random_state,
-        )
-
-        if self.calibration_model is not None:
-            self.calibration_model.base_estimator = model
-            model = self.calibration_model
+        model_index = {name: i for i, name in enumerate(self.base_predictors)}
 
-        model.fit(X_sample, y_sample)
+        # inner test folds are stacked in fold order
+        fold_sizes = {d["fold id"]: len(d["y_pred"]) for d in list_of_dicts}
+        offsets = np.cumsum([0] + [fold_sizes[k] for k in range(len(fold_sizes))])
 
-        if model_building:
-            results_dict = {
-                "model name": model_name,
-                "sample id": sample_id,
-                "pickled model": pickle.dumps(
-                    model
-                ),  # pickle model to reduce memory usage. use pickle.loads() to de-serialize
-            }
-
-        else:
-            y_pred = safe_predict_proba(model, X_test)
+        predictions = np.empty((offsets[-1], len(model_index), self.n_samples))
+        labels = None
+        for d in list_of_dicts:
+            rows = slice(offsets[d["fold id"]], offsets[d["fold id"] + 1])
+            predictions[rows, model_index[d["model name"]], d["sample id"]] = d[
+                "y_pred"
+            ]
+            if labels is None:
+                labels = np.empty(offsets[-1], dtype=np.asarray(d["labels"]).dtype)
+            if model_index[d["model name"]] == 0 and d["sample id"] == 0:
+                labels[rows] = d["labels"]
 
-            results_dict = {
-                "model name": model_name,
-                "sample id": sample_id,
-                "fold id": fold_id,
-                "y_pred": y_pred,
-                "labels": y_test,
-            }
+        return predictions, labels
 
-        return results_dict
-
-    def _combine_predictions_inner(self, list_of_dicts, modality):
-        """
-        Combine the predictions arising from the inner cross validation.
-        """
-
-        # dictionary to store predictions
-        combined_predictions = {}
-        # combine fold predictions for each model
-        for model_name in self.base_predictors.keys():
-            for sample_id in range(self.n_samples):
-                model_predictions = np.concatenate(
-                    list(
-                        d["y_pred"]
-                        for d in list_of_dicts
-                        if d["model name"] == model_name and d["sample id"] == sample_id
-                    )
-                )
-                combined_predictions[
-                    modality, model_name, sample_id
-                ] = model_predictions
-        labels = np.concatenate(
-            list(
-                d["labels"]
-                for d in list_of_dicts
-                if d["model name"] == list(self.base_predictors.keys())[0]
-                and d["sample id"] == 0
-            )
-        )
-        combined_predictions = pd.DataFrame(combined_predictions).rename_axis(
-            ["modality", "base predictor", "sample"], axis=1
-        )
-        combined_predictions["labels"] = labels
-        return combined_predictions
-
-    def _combine_predictions_outer(self, list_of_dicts, modality, model_building=False):
+    def _combine_predictions_outer(
+        self, list_of_dicts, model_building=False, base_predictors=None
+    ):
         """
-        Combine the predictions arising from the inner cross validation.
+        Combine the predictions arising from the outer cross validation into
+        (predictions, labels) arrays for each fold.
         """
 
         if model_building:
@@ -614,41 +1256,41 @@ class EnsembleIntegration:
         else:
             k_outer = self.k_outer
 
-        combined_predictions = []
-
-        for fold_id in range(k_outer):
-            predictions = {}
-            for model_name in self.base_predictors.keys():
-                for sample_id in range(self.n_samples):
-                    model_predictions = list(
-                        d["y_pred"]
-                        for d in list_of_dicts
-                        if d["fold id"] == fold_id
-                        and d["model name"] == model_name
-                        and d["sample id"] == sample_id
-                    )
-                    predictions[modality, model_name, sample_id] = model_predictions[0]
-            predictions = pd.DataFrame(predictions)
-
-            if not model_building:
-                labels = [
-                    d["labels"]
-                    for d in list_of_dicts
-                    if d["fold id"] == fold_id
-                    and d["model name"] == list(self.base_predictors.keys())[0]
-                    and d["sample id"] == 0
-                ]
-                predictions["labels"] = labels[0]
-
-            combined_predictions.append(
-                predictions.rename_axis(
-                    ["modality", "base predictor", "sample"], axis=1
+        if base_predictors is None:
+            base_predictors = self.base_predictors
+        model_index = {name: i for i, name in enumerate(base_predictors)}
+
+        predictions = [None] * k_outer
+        labels = [None] * k_outer
+        for d in list_of_dicts:
+            fold_id = d["fold id"]
+            if predictions[fold_id] is None:
+                predictions[fold_id] = np.empty(
+                    (len(d["y_pred"]), len(model_index), self.n_samples)
                 )
-            )
+            predictions[fold_id][:, model_index[d["model name"]], d["sample id"]] = d[
+                "y_pred"
+            ]
+            if not model_building and labels[fold_id] is None:
+                labels[fold_id] = d["labels"]
+
+        return list(zip(predictions, labels))
+
+    def _add_to_store(self, store, fold_predictions, modality, base_predictors=None):
+        """
+        Add (predictions, labels, row indices) of each fold to a MetaDataStore.
+        """
 
-        return combined_predictions
+        if store is None:
+            store = MetaDataStore()
+        if base_predictors is None:
+            base_predictors = self.base_predictors
+        predictions, labels, row_indices = zip(*fold_predictions)
+        return store.add_modality(
+            modality, list(base_predictors), predictions, labels, row_indices
+        )
 
-    def save(self, path=None):
+    def save(self, path=None, directory=False):
         """
         Save to path.
 
@@ -657,16 +1299,23 @@ class EnsembleIntegration:
 
         path : optional, default=None
             Path to save the EnsembleIntegration class object.
+        directory : bool, default=False
+            If True, save as a directory with separate files for metadata, fold
+            plan, meta data and each final model, so that load can
+            memory-map the meta data and read models only when used.
         """
 
         if path is None:
             path = f"EI.{self.project_name}"
-        with open(path, "wb") as f:
-            pickle.dump(self, f)
+        if directory:
+            save_directory(self, path)
+        else:
+            with open(path, "wb") as f:
+                pickle.dump(self, f)
         print(f"\nSaved to {path}\n")
 
     @classmethod
-    def load(cls, path):
+    def load(cls, path, mmap_mode="r"):
         """
         Load from path.
 
@@ -675,6 +1324,11 @@ class EnsembleIntegration:
 
         path : str
             Path to load the EnsembleIntegration class object.
+        mmap_mode : str, default='r'
+            Memory-map mode of the meta data arrays, if path is a directory
+            saved with directory=True. None reads them into memory.
         """
+        if os.path.isdir(path):
+            return load_directory(path, mmap_mode=mmap_mode)
         with open(path, "rb") as f:
             return pickle.load(f)
@@ -0,0 +1,116 @@
+import numpy as np
+from eipy.utils import sample_indices
+
+
+class FoldPlan:
+    """
+    Outer and inner cross validation splits, computed once from the labels.
+
+    All indices are int32 positions in the data passed to train_base, inner
+    fold indices included, so one plan serves every modality, base predictor,
+    sample and training phase, and tasks only need the index arrays.
+
+    Attributes
+    ----------
+    outer : list of tuple of array
+        (train, test) indices of each outer fold.
+    inner : list of list of tuple of array
+        (train, test) indices of each inner fold, for each outer fold.
+    final_inner : list of tuple of array
+        (train, test) indices of each inner fold on all rows, used to generate
+        meta training data for the final models.
+    labels : array
+        Labels the plan was computed from.
+    """
+
+    def __init__(self, outer, inner, final_inner, labels):
+        self.outer = outer
+        self.inner = inner
+        self.final_inner = final_inner
+        self.labels = labels
+        self._samples = {}
+
+    @classmethod
+    def from_cv(cls, y, cv_outer, cv_inner):
+        """
+        Compute the plan of sklearn-like cross validators on labels y.
+        """
+        y = np.asarray(y)
+        rows = np.arange(len(y), dtype=np.int32)
+        outer = _split(cv_outer, rows, y)
+        inner = [_split(cv_inner, train_index, y) for train_index, _ in outer]
+        final_inner = _split(cv_inner, rows, y)
+        return cls(outer, inner, final_inner, y.copy())
+
+    @property
+    def n_rows(self):
+        return len(self.labels)
+
+    @property
+    def final(self):
+        """
+        Single split training the final models on all rows.
+        """
+        return [
+            (np.arange(self.n_rows, dtype=np.int32), np.empty(0, dtype=np.int32))
+        ]
+
+    def check(self, y):
+        """
+        Raise a ValueError if y differs from the labels of the plan.
+        """
+        if not np.array_equal(self.labels, np.asarray(y)):
+            raise ValueError(
+                "y does not match the labels the fold plan was computed from."
+            )
+
+    def samples(self, key, train_index, strategy, random_states):
+        """
+        Row indices of the class-balanced samples of train_index, an array of
+        shape (len(random_states), n_rows) whose sample k is drawn by
+        utils.sample_indices seeded with random_states[k], as utils.sample
+        would draw it. Samples are computed once per key, e.g. (split, fold
+        id), and shared by every base predictor until clear_samples is called.
+        """
+        key = (key, strategy, tuple(random_states))
+        if key not in self._samples:
+            y = self.labels[train_index]
+            self._samples[key] = train_index[
+                np.stack(
+                    [
+                        sample_indices(y, strategy, random_state=random_state)
+                        for random_state in random_states
+                    ]
+                )
+            ]
+        return self._samples[key]
+
+    def clear_samples(self):
+        """
+        Drop the cached samples, e.g. once a modality is trained.
+        """
+        self._samples = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_samples"] = {}
+        return state
+
+    def __setstate__(self, state):
+        state.setdefault("_samples", {})
+        self.__dict__.update(state)
+
+    @staticmethod
+    def row_indices(inner_splits):
+        """
+        Row indices of meta training data generated on inner splits, which
+        follow the inner test folds.
+        """
+        return np.concatenate([test_index for _, test_index in inner_splits])
+
+
+def _split(cv, rows, y):
+    return [
+        (rows[train_index], rows[test_index])
+        for train_index, test_index in cv.split(np.empty(len(rows)), y[rows])
+    ]
@@ -0,0 +1,266 @@
+import numpy as np
+import pandas as pd
+from itertools import zip_longest
+from joblib import Parallel, delayed
+from eipy.utils import load_model, safe_predict_proba
+
+
+class CompiledPredictor:
+    """
+    Predictor built once from the final models of a trained
+    EnsembleIntegration object.
+
+    Base models are deserialized when the predictor is built and meta models
+    when they are first used. Both are kept in memory, so repeated calls to
+    predict only run the models. Base models of all modalities are run in
+    parallel and several meta models can be scored on the same base
+    predictions.
+
+    Parameters
+    ----------
+    EI : EnsembleIntegration
+        Trained EnsembleIntegration object with model_building=True.
+    meta_model_keys : list of str, default=None
+        Keys of the final meta models to use. If None, all are used.
+    n_jobs : int, default=1
+        Number of threads running base models. Most sklearn-like models
+        release the GIL while predicting.
+
+    Attributes
+    ----------
+    base_models : dict
+        Deserialized base models of each modality, as (base predictor index,
+        sample id, model) tuples.
+    meta_models : dict
+        Meta models deserialized so far.
+    """
+
+    def __init__(self, EI, meta_model_keys=None, n_jobs=1):
+        if meta_model_keys is None:
+            meta_model_keys = list(EI.final_models["meta models"])
+
+        self.modality_names = list(EI.modality_names)
+        self.n_features_per_modality = list(EI.n_features_per_modality)
+        self.base_predictors = {
+            modality: EI.meta_training_store_final.base_predictors[modality]
+            for modality in self.modality_names
+        }
+        self.n_samples = EI.n_samples
+        self.aggregate = EI.sampling_aggregation == "mean"
+        self.n_jobs = n_jobs
+
+        self.base_models = {}
+        for modality in self.modality_names:
+            model_index = {
+                name: i for i, name in enumerate(self.base_predictors[modality])
+            }
+            self.base_models[modality] = [
+                (
+                    model_index[d["model name"]],
+                    d["sample id"],
+                    load_model(d["pickled model"]),
+                )
+                for d in EI.final_models["base models"][modality]
+            ]
+
+        self.meta_model_keys = list(meta_model_keys)
+        self._serialized_meta_models = {
+            key: EI.final_models["meta models"][key] for key in meta_model_keys
+        }
+        self.meta_models = {}
+
+        # meta features as laid out by MetaDataStore.X for the final models
+        columns = EI.meta_training_store_final.columns(aggregate=self.aggregate)
+        if self.aggregate:
+            self.column_order = sorted(range(len(columns)), key=columns.__getitem__)
+            self.columns = columns[self.column_order]
+        else:
+            self.column_order = None
+            self.columns = columns
+
+    def predict_base(self, X_dict):
+        """
+        Meta features of X_dict, predicted by the final base models.
+
+        Parameters
+        ----------
+        X_dict : dict
+            Dictionary of X modalities each having n_samples. Keys and
+            n_features must match those seen by train_base.
+
+        Returns
+        -------
+        meta_features : pandas.DataFrame
+            Base predictions arranged as the meta training data of the final
+            meta models.
+        """
+        for modality, n_features in zip(
+            self.modality_names, self.n_features_per_modality
+        ):
+            X = X_dict[modality]
+            assert X.shape[1] == n_features, (
+                f"{X.shape[1]} features were given for {modality} modality, but"
+                f" {n_features} were used during training."
+            )
+
+        tasks = [
+            (modality, i, X_dict[modality], model)
+            for modality in self.modality_names
+            for i, (_, _, model) in enumerate(self.base_models[modality])
+        ]
+        if self.n_jobs == 1:
+            outputs = [safe_predict_proba(model, X) for _, _, X, model in tasks]
+        else:
+            outputs = Parallel(n_jobs=self.n_jobs, prefer="threads")(
+                delayed(safe_predict_proba)(model, X) for _, _, X, model in tasks
+            )
+
+        n_rows = len(outputs[0])
+        blocks = {
+            modality: np.empty(
+                (n_rows, len(self.base_predictors[modality]), self.n_samples)
+            )
+            for modality in self.modality_names
+        }
+        for (modality, i, _, _), y_pred in zip(tasks, outputs):
+            model_index, sample_id, _ = self.base_models[modality][i]
+            blocks[modality][:, model_index, sample_id] = y_pred
+
+        if self.aggregate:
+            blocks = [blocks[modality].mean(axis=2) for modality in blocks]
+        else:
+            blocks = list(blocks.values())
+        meta_features = np.hstack([block.reshape(n_rows, -1) for block in blocks])
+        if self.column_order is not None:
+            meta_features = meta_features[:, self.column_order]
+
+        return pd.DataFrame(meta_features, columns=self.columns)
+
+    def predict(self, X_dict, meta_model_keys=None):
+        """
+        Predict positive class probabilities of the samples in X_dict.
+
+        Parameters
+        ----------
+        X_dict : dict
+            Dictionary of X modalities each having n_samples. Keys and
+            n_features must match those seen by train_base.
+        meta_model_keys : str or list of str, default=None
+            Key, or keys, of the meta models to use. If None, all meta models
+            of the predictor are used.
+
+        Returns
+        -------
+        y_pred : array of shape (n_samples,) or pandas.DataFrame
+            Predictions of the meta model if meta_model_keys is a str,
+            otherwise a DataFrame with a column of predictions per meta model.
+        """
+        meta_features = self.predict_base(X_dict)
+
+        if isinstance(meta_model_keys, str):
+            return safe_predict_proba(self._meta_model(meta_model_keys), meta_features)
+
+        if meta_model_keys is None:
+            meta_model_keys = self.meta_model_keys
+        return pd.DataFrame(
+            {
+                key: safe_predict_proba(self._meta_model(key), meta_features)
+                for key in meta_model_keys
+            }
+        )
+
+    def _meta_model(self, key):
+        """
+        Meta model of key, deserialized on first use.
+        """
+        if key not in self.meta_models:
+            self.meta_models[key] = load_model(self._serialized_meta_models[key])
+        return self.meta_models[key]
+
+    def predict_chunks(self, X_dict, meta_model_keys=None, chunk_size=10000):
+        """
+        Predict in row chunks, keeping peak memory bounded by the chunk size.
+
+        Parameters
+        ----------
+        X_dict : dict
+            Dictionary of X modalities. Values are either arrays (including
+            numpy memory maps and DataFrames), sliced into chunks of chunk_size
+            rows, or iterables yielding matching row chunks of each modality.
+        meta_model_keys : str or list of str, default=None
+            As in predict.
+        chunk_size : int, default=10000
+            Number of rows per chunk, for array inputs.
+
+        Yields
+        ------
+        y_pred : array or pandas.DataFrame
+            Predictions of each chunk, as returned by predict.
+        """
+        for chunk in _iter_chunks(X_dict, self.modality_names, chunk_size):
+            yield self.predict(chunk, meta_model_keys)
+
+    def predict_to_file(self, X_dict, path, meta_model_keys=None, chunk_size=10000):
+        """
+        Predict in row chunks, appending the predictions of each chunk to a CSV
+        file with a column per meta model.
+
+        Parameters
+        ----------
+        X_dict : dict
+            As in predict_chunks.
+        path : str
+            Path of the CSV file to write.
+        meta_model_keys : list of str, default=None
+            Keys of the meta models to use. If None, all meta models of the
+            predictor are used.
+        chunk_size : int, default=10000
+            Number of rows per chunk, for array inputs.
+
+        Returns
+        -------
+        n_rows : int
+            Number of rows written.
+        """
+        if isinstance(meta_model_keys, str):
+            meta_model_keys = [meta_model_keys]
+
+        n_rows = 0
+        with open(path, "w", newline="") as f:
+            for y_pred in self.predict_chunks(X_dict, meta_model_keys, chunk_size):
+                y_pred.to_csv(f, header=n_rows == 0, index=False)
+                n_rows += len(y_pred)
+        return n_rows
+
+
+_EXHAUSTED = object()  # fill value of modality chunk iterables that ran out
+
+
+def _iter_chunks(X_dict, modality_names, chunk_size):
+    """
+    Yield dictionaries of matching row chunks of each modality.
+    """
+    if all(hasattr(X_dict[modality], "shape") for modality in modality_names):
+        n_rows = {len(X_dict[modality]) for modality in modality_names}
+        if len(n_rows) != 1:
+            raise ValueError("Modalities have different numbers of rows.")
+        for start in range(0, n_rows.pop(), chunk_size):
+            rows = slice(start, start + chunk_size)
+            yield {
+                modality: _slice_rows(X_dict[modality], rows)
+                for modality in modality_names
+            }
+    else:
+        iterators = [iter(X_dict[modality]) for modality in modality_names]
+        for chunks in zip_longest(*iterators, fillvalue=_EXHAUSTED):
+            if any(chunk is _EXHAUSTED for chunk in chunks):
+                raise ValueError("Modalities have different numbers of chunks.")
+            if len({len(chunk) for chunk in chunks}) != 1:
+                raise ValueError("Chunks of modalities have different numbers of rows.")
+            yield dict(zip(modality_names, chunks))
+
+
+def _slice_rows(X, rows):
+    if hasattr(X, "iloc"):
+        return X.iloc[rows]
+    return X[rows]
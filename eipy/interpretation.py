@@ -1,28 +1,355 @@
-from sklearn.inspection import permutation_importance
-from eipy.utils import retrieve_X_y, bar_format, format_input_datatype
+from eipy.utils import bar_format, format_input_datatype, load_model
 import pandas as pd
 from tqdm import tqdm
 import numpy as np
 import copy
-from sklearn.metrics import make_scorer
-import pickle
 from itertools import groupby
 from operator import itemgetter
-from sklearn.ensemble import VotingClassifier
-from sklearn.preprocessing import LabelEncoder
+from sklearn.utils import check_random_state
+from sklearn.model_selection import train_test_split
+from scipy.cluster import hierarchy
+from scipy import stats
+from joblib import Parallel, delayed, effective_n_jobs
 
 import warnings
 
 warnings.filterwarnings("ignore")
 
 
+def permutation_importances(
+    groups,
+    X,
+    y,
+    metric,
+    greater_is_better=True,
+    needs_proba=True,
+    n_repeats=10,
+    n_jobs=1,
+    random_state=None,
+    feature_groups=None,
+    min_repeats=None,
+    confidence=0.95,
+):
+    """
+    Permutation importances of several groups of models sharing the same
+    input features.
+
+    Each permuted copy of a feature is generated once and every group of
+    models is scored on it, so permutation and data copies are shared by all
+    groups. Permutations follow sklearn's permutation_importance (one seed
+    drawn from random_state, reused for every feature), so each group gets
+    the importances permutation_importance would give for a model averaging
+    the predictions of the group.
+
+    With min_repeats, features are first permuted min_repeats times. Repeats
+    are then added one at a time, up to n_repeats, only for features whose
+    rank is not settled yet. A feature's rank is settled when its Student-t
+    confidence interval does not overlap those of its neighbours in the
+    importance ranking of every group of models. Features whose interval lies
+    at or below zero, e.g. features with zero importance in every repeat, are
+    settled as unimportant.
+
+    Parameters
+    ----------
+    groups : list of list of estimators
+        Fitted models of each group. Predictions of a group are the mean
+        positive class probability of its models.
+    X : array or pandas.DataFrame of shape (n_samples, n_features)
+        Input features. Models are scored on DataFrames with the same columns
+        if X is a DataFrame.
+    y : array of shape (n_samples,)
+        Target vector relative to X.
+    metric : function
+        sklearn-like metric function.
+    greater_is_better : bool, default=True
+        Whether higher metric values are better.
+    needs_proba : bool or list of bool, default=True
+        Whether models are scored on probabilities or on predictions, for all
+        groups or for each group.
+    n_repeats : int, default=10
+        Number of permutations of each feature, or maximum number of
+        permutations with min_repeats.
+    n_jobs : int, default=1
+        Number of joblib workers, each permuting a block of features.
+    random_state : int, default=None
+        Seed of the permutations.
+    feature_groups : list of array-like of int, default=None
+        Column indices of feature blocks. The columns of a block are permuted
+        together, with the same row shuffle. If None, each feature is permuted
+        on its own.
+    min_repeats : int, default=None
+        Number of permutations of every feature before stopping early. If
+        None, all features are permuted n_repeats times.
+    confidence : float, default=0.95
+        Confidence level of the Student-t intervals of mean importances used
+        to stop early.
+
+    Returns
+    -------
+    importances : array of shape (n_groups, n_features, n_repeats)
+        Decrease in score after each permutation. With feature_groups, axis 1
+        follows the feature blocks. Repeats skipped by early stopping are
+        NaN.
+    """
+    if min_repeats is not None and not 2 <= min_repeats <= n_repeats:
+        raise ValueError("min_repeats must be between 2 and n_repeats.")
+
+    columns = getattr(X, "columns", None)
+    X = np.asarray(X)
+    if np.ndim(needs_proba) == 0:
+        needs_proba = [needs_proba] * len(groups)
+    sign = 1 if greater_is_better else -1
+    random_seed = check_random_state(random_state).randint(np.iinfo(np.int32).max + 1)
+
+    baseline = np.array(
+        [
+            _score_group(models, X, y, metric, sign, group_needs_proba, columns)
+            for models, group_needs_proba in zip(groups, needs_proba)
+        ]
+    )
+
+    if feature_groups is None:
+        feature_groups = [[feature] for feature in range(X.shape[1])]
+    feature_groups = [np.asarray(features, dtype=int) for features in feature_groups]
+
+    # permutation state of each feature block: its random state, sklearn's
+    # shuffling indices and the composed row order of the permuted block
+    states = [
+        (check_random_state(random_seed), np.arange(len(X)), np.arange(len(X)))
+        for _ in feature_groups
+    ]
+
+    importances = np.full((len(groups), len(feature_groups), n_repeats), np.nan)
+    n_done = np.zeros(len(feature_groups), dtype=int)
+    active = np.arange(len(feature_groups))
+    round_repeats = n_repeats if min_repeats is None else min_repeats
+
+    while active.size:
+        n_chunks = min(active.size, effective_n_jobs(n_jobs) * 4)
+        chunks = np.array_split(active, n_chunks)
+        outputs = Parallel(n_jobs=n_jobs)(
+            delayed(_permutation_scores)(
+                groups,
+                X,
+                y,
+                [feature_groups[k] for k in chunk],
+                [states[k] for k in chunk],
+                round_repeats,
+                metric,
+                sign,
+                needs_proba,
+                columns,
+            )
+            for chunk in chunks
+        )
+        scores = np.concatenate([scores for scores, _ in outputs], axis=1)
+        for chunk, (_, chunk_states) in zip(chunks, outputs):
+            for k, state in zip(chunk, chunk_states):
+                states[k] = state
+
+        for repeat in range(round_repeats):
+            importances[:, active, n_done[active] + repeat] = (
+                baseline[:, None] - scores[:, :, repeat]
+            )
+        n_done[active] += round_repeats
+
+        if min_repeats is None:
+            break
+        active = np.flatnonzero(
+            _unsettled(importances, confidence) & (n_done < n_repeats)
+        )
+        round_repeats = 1
+
+    return importances
+
+
+def _permutation_scores(
+    groups,
+    X,
+    y,
+    feature_groups,
+    states,
+    n_repeats,
+    metric,
+    sign,
+    needs_proba,
+    columns=None,
+):
+    """
+    Scores of every group of models with each feature block permuted n_repeats
+    more times, as an array of shape (n_groups, n_feature_blocks, n_repeats),
+    and the permutation states of the blocks.
+    """
+    # writable copy, shared by all feature blocks of the chunk
+    X_permuted = np.array(X)
+    scores = np.empty((len(groups), len(feature_groups), n_repeats))
+    for i, (features, (random_state, shuffling_idx, order)) in enumerate(
+        zip(feature_groups, states)
+    ):
+        for repeat in range(n_repeats):
+            random_state.shuffle(shuffling_idx)
+            order = order[shuffling_idx]
+            X_permuted[:, features] = X[np.ix_(order, features)]
+            for g, models in enumerate(groups):
+                scores[g, i, repeat] = _score_group(
+                    models, X_permuted, y, metric, sign, needs_proba[g], columns
+                )
+        X_permuted[:, features] = X[:, features]
+        states[i] = (random_state, shuffling_idx, order)
+    return scores, states
+
+
+def _unsettled(importances, confidence):
+    """
+    Feature blocks whose importance interval overlaps that of a neighbour in
+    the importance ranking of any group of models, and does not lie at or
+    below zero.
+    """
+    n_repeats = np.sum(~np.isnan(importances), axis=2)
+    mean = np.nanmean(importances, axis=2)
+    half_width = (
+        stats.t.ppf(0.5 + confidence / 2, df=n_repeats - 1)
+        * np.nanstd(importances, axis=2, ddof=1)
+        / np.sqrt(n_repeats)
+    )
+    lower, upper = mean - half_width, mean + half_width
+
+    overlaps = np.zeros(importances.shape[:2], dtype=bool)
+    for g in range(len(importances)):
+        order = np.argsort(mean[g], kind="stable")
+        # intervals of consecutive blocks in the ranking overlap
+        overlap = lower[g, order[1:]] < upper[g, order[:-1]]
+        overlaps[g, order[1:]] |= overlap
+        overlaps[g, order[:-1]] |= overlap
+    return np.any(overlaps & (upper > 0), axis=0)
+
+
+def correlation_feature_groups(X, feature_names, threshold=0.8):
+    """
+    Group features into clusters of correlated features.
+
+    Features are clustered by average-linkage hierarchical clustering on the
+    distance 1 - |Pearson correlation|, cut so that features in a cluster have
+    an average absolute correlation of at least threshold. Constant features
+    are treated as uncorrelated with all others.
+
+    Correlations are computed in float32 blocks of rows and written directly
+    into the condensed distance vector used by the clustering, so the full
+    n_features x n_features matrix is never held. Clustering still needs about
+    8 * n_features**2 bytes (the condensed float64 distances and scipy's copy
+    of them), e.g. 3.2 GB for 20,000 features. Beyond that, pass explicit
+    feature groups instead.
+
+    Parameters
+    ----------
+    X : array of shape (n_samples, n_features)
+        Input features.
+    feature_names : list of str
+        Names of the columns of X.
+    threshold : float, default=0.8
+        Minimum average absolute correlation within a cluster.
+
+    Returns
+    -------
+    feature_groups : dict
+        Lists of feature names of each cluster, keyed by "cluster_<k>". Clusters
+        are numbered in the order of their first feature.
+    """
+    feature_names = list(feature_names)
+    if len(feature_names) == 1:
+        return {"cluster_0": feature_names}
+
+    linkage = hierarchy.linkage(_correlation_distances(X), method="average")
+    labels = hierarchy.fcluster(linkage, t=1 - threshold, criterion="distance")
+
+    cluster_names = {}
+    feature_groups = {}
+    for feature, label in zip(feature_names, labels):
+        cluster_name = cluster_names.setdefault(label, f"cluster_{len(cluster_names)}")
+        feature_groups.setdefault(cluster_name, []).append(feature)
+    return feature_groups
+
+
+def _correlation_distances(X, block_size=256):
+    """
+    Condensed distances 1 - |Pearson correlation| between the columns of X,
+    in the condensed layout of scipy.spatial.distance.pdist.
+    """
+    Z = np.array(X, dtype=np.float32)
+    Z -= Z.mean(axis=0)
+    norms = np.sqrt(np.einsum("ij,ij->j", Z, Z))
+    norms[norms == 0] = np.inf  # constant features are uncorrelated
+    Z /= norms
+
+    n_features = Z.shape[1]
+    distances = np.empty(n_features * (n_features - 1) // 2)
+    start = 0
+    for first in range(0, n_features - 1, block_size):
+        rows = np.arange(first, min(first + block_size, n_features - 1))
+        correlation = Z[:, rows].T @ Z
+        for row, row_correlation in zip(rows, correlation):
+            end = start + n_features - row - 1
+            distances[start:end] = 1 - np.abs(row_correlation[row + 1 :])
+            start = end
+    return np.clip(distances, 0, 1, out=distances)
+
+
+def _score_group(models, X, y, metric, sign, needs_proba, columns=None):
+    """
+    Score of a group of models trained on different samples, averaging their
+    probabilities like a soft VotingClassifier, or their predictions if not
+    needs_proba.
+    """
+    if columns is not None:
+        X = pd.DataFrame(X, columns=columns, copy=False)
+    if needs_proba:
+        y_pred = [model.predict_proba(X)[:, 1] for model in models]
+    else:
+        y_pred = [model.predict(X) for model in models]
+    if len(models) > 1:
+        y_pred = np.mean(y_pred, axis=0)
+    else:
+        y_pred = y_pred[0]
+    return sign * metric(y, y_pred)
+
+
+def _check_subsample(subsample):
+    if subsample is None:
+        return None
+    if isinstance(subsample, (bool, np.bool_)) or not isinstance(
+        subsample, (int, float, np.integer, np.floating)
+    ):
+        raise TypeError(f"subsample must be a float or an int, got {subsample!r}.")
+    if isinstance(subsample, (int, np.integer)) and subsample < 1:
+        raise ValueError(f"subsample must be at least 1 row, got {subsample}.")
+    if subsample <= 0:
+        raise ValueError(f"subsample must be positive, got {subsample}.")
+    return subsample
+
+
+def _load_base_model_groups(base_models):
+    """
+    Deserialized base models grouped by base predictor name, in name order.
+    """
+    base_models = sorted(base_models, key=itemgetter("model name"))
+    return [
+        (
+            model_name,
+            [load_model(d["pickled model"]) for d in base_models_per_sample],
+        )
+        for model_name, base_models_per_sample in groupby(
+            base_models, key=itemgetter("model name")
+        )
+    ]
+
+
 class PermutationInterpreter:
     """
     Permuation importance based interpreter.
 
-    This method utilizes sklearn's `permutation_importance
+    Importances follow sklearn's `permutation_importance
     <https://scikit-learn.org/stable/modules/generated/sklearn.inspection.permutation_importance.html>`_
-    function.
+    function, with permutations shared by all base predictors of a modality.
 
     EI : EnsembleIntegration class object
         Fitted EnsembleIntegration model, i.e. with model_building=True.
@@ -36,11 +363,42 @@ class PermutationInterpreter:
         a list.
     metric_greater_is_better: default=True
         Metric greater is better.
+    feature_groups : dict or str, default=None
+        Blocks of features permuted together in local_feature_rank, so that
+        LFRs and feature rankings are computed per block rather than per
+        feature. A dict keyed by modality, whose values are either a dict
+        mapping group names to lists of feature names (as in
+        EI.feature_names_dict), e.g. gene sets, or "correlation" for clusters
+        of correlated features. Only the listed groups of a modality are
+        ranked, and groups may overlap. Modalities missing from the dict are
+        ranked per feature. Pass "correlation" to cluster every modality.
+    correlation_threshold : float, default=0.8
+        Minimum average absolute correlation of features within a correlation
+        cluster.
+    subsample : float or int, default=None
+        Fraction (float > 0) or number (int >= 1) of rows, drawn with
+        stratification on the labels, on which LFRs and LMRs are computed. If
+        None, a fraction of at least 1 or a number of at least the number of
+        rows, all rows are used.
+    min_repeats : int, default=None
+        If not None, features are permuted min_repeats times, and further
+        repeats, up to n_repeats, are only run for features whose importance
+        confidence interval still overlaps that of a neighbour in the ranking.
+        Features with an interval at or below zero stop early as unimportant.
+    confidence : float, default=0.95
+        Confidence level of the importance intervals used with min_repeats.
 
     Attributes
     ----------
     ensemble_feature_ranking : pandas.DataFrame
         Feature rankings for each ensemble method.
+    feature_groups_ : dict
+        Feature names of each feature group ranked in local_feature_rank, for
+        each modality with feature_groups.
+    budget_ : pandas.DataFrame
+        Rows, features and permutation repeats used by each ranking, for each
+        modality (LFR) or ensemble method (LMR), with the fraction of the full
+        budget of n_repeats permutations of every feature on all rows.
     LFR : pandas.DataFrame
         Local feature rankings for each base predictor.
     LMR : pandas.Dataframe
@@ -60,13 +418,25 @@ class PermutationInterpreter:
         n_repeats=10,
         meta_predictor_keys="all",
         metric_greater_is_better=True,  # can be "all" or a list of keys for ensemble methods
+        feature_groups=None,
+        correlation_threshold=0.8,
+        subsample=None,
+        min_repeats=None,
+        confidence=0.95,
     ):
         self.EI = EI
         self.metric = metric
         self.n_repeats = n_repeats
         self.meta_predictor_keys = meta_predictor_keys
         self.metric_greater_is_better = metric_greater_is_better
-
+        self.feature_groups = feature_groups
+        self.correlation_threshold = correlation_threshold
+        self.subsample = _check_subsample(subsample)
+        self.min_repeats = min_repeats
+        self.confidence = confidence
+
+        self.feature_groups_ = {}
+        self.budget_ = None
         self.LFR = None
         self.LMR = None
 
@@ -165,6 +535,12 @@ class PermutationInterpreter:
 
         importance_list = []
 
+        y = np.asarray(y)
+        n_rows = len(y)
+        rows = self._subsample_rows(y)
+        y = y[rows]
+        self._reset_budget("LFR")
+
         for modality_name in tqdm(
             self.EI.modality_names,
             desc="Calculating local feature ranks",
@@ -173,80 +549,43 @@ class PermutationInterpreter:
             # TODO: handle dataframe here
             X = X_dict[modality_name]
             X_np, feature_names = format_input_datatype(X, modality_name=modality_name)
+            X_np = X_np[rows]
 
-            base_models = copy.deepcopy(
+            groups = _load_base_model_groups(
                 self.EI.final_models["base models"][modality_name]
             )
+            needs_proba = [
+                all(hasattr(model, "predict_proba") for model in models)
+                for _, models in groups
+            ]
+            feature_ids, feature_blocks = self._feature_blocks(modality_name, X_np)
+
+            importances = permutation_importances(
+                groups=[models for _, models in groups],
+                X=X_np,
+                y=y,
+                metric=self.metric,
+                greater_is_better=self.metric_greater_is_better,
+                needs_proba=needs_proba,
+                n_repeats=self.n_repeats,
+                n_jobs=self.EI.n_jobs,
+                random_state=self.EI.random_state,
+                feature_groups=feature_blocks,
+                min_repeats=self.min_repeats,
+                confidence=self.confidence,
+            )
+            self._add_to_budget("LFR", modality_name, len(rows), n_rows, importances)
 
-            base_models = sorted(base_models, key=itemgetter("model name"))
-
-            for _key, base_models_per_sample in groupby(
-                base_models, key=itemgetter("model name")
-            ):
-                list_of_base_models = []
-
-                for base_model_dict in base_models_per_sample:
-                    base_model = pickle.loads(base_model_dict["pickled model"])
-                    list_of_base_models.append(
-                        (
-                            str(base_model_dict["sample id"]),
-                            base_model,
-                        )
-                    )  # list of tuples for VotingClassifier
-
-                if (
-                    len(list_of_base_models) > 1
-                ):  # take mean of base predictors with different sample ids
-                    ###################################################################
-                    #  This code is a work around and may be fragile. We use VotingClassifier
-                    # to combine models trained on different samples (taking a mean of model
-                    # output). The current sklearn implementation of VotingClassifier does not
-                    # accept pretrained models, so we set parameters ourselves to allow it. In
-                    # the future it may be possible to use VotingClassifier alone without
-                    # additional code. An sklearn-like model is needed to be passed to
-                    # permutation_importance.
-
-                    model = VotingClassifier(
-                        estimators=list_of_base_models,
-                        voting="soft",
-                        weights=np.ones(len(list_of_base_models)),
-                    )  # average predictions of models built on different data samples
-
-                    model.estimators_ = [j for _, j in list_of_base_models]
-                    model.le_ = LabelEncoder().fit(y)
-                    model.classes_ = model.le_.classes_
-
-                    ##################################################################
-
-                else:
-                    model = list_of_base_models[0][1]
-
-                needs_proba = hasattr(base_model, "predict_proba")
-                scorer_ = make_scorer(
-                    self.metric,
-                    greater_is_better=self.metric_greater_is_better,
-                    needs_proba=needs_proba,
-                )
-
-                pi = permutation_importance(
-                    estimator=model,
-                    X=X_np,
-                    y=y,
-                    n_repeats=self.n_repeats,
-                    n_jobs=self.EI.n_jobs,
-                    random_state=self.EI.random_state,
-                    scoring=scorer_,
-                )
-
+            for (model_name, _), importances_group in zip(groups, importances):
                 pi_df = pd.DataFrame(
                     {
-                        "local_importance_mean": pi.importances_mean,
-                        "local_importance_std": pi.importances_std,
-                        "local_feature_id": self.EI.feature_names_dict[modality_name],
+                        "local_importance_mean": np.nanmean(importances_group, axis=1),
+                        "local_importance_std": np.nanstd(importances_group, axis=1),
+                        "local_feature_id": feature_ids,
                     }
                 )
 
-                pi_df["base predictor"] = base_model_dict["model name"]
+                pi_df["base predictor"] = model_name
                 pi_df["modality"] = modality_name
                 pi_df["LFR"] = pi_df["local_importance_mean"].rank(
                     pct=True, ascending=False
@@ -257,6 +596,98 @@ class PermutationInterpreter:
 
         return self
 
+    def _subsample_rows(self, y):
+        """
+        Indices of a stratified subsample of subsample rows, in their original
+        order.
+        """
+        indices = np.arange(len(y))
+        if self.subsample is None or self.subsample >= (
+            len(y) if isinstance(self.subsample, (int, np.integer)) else 1
+        ):
+            return indices
+        rows, _ = train_test_split(
+            indices,
+            train_size=self.subsample,
+            stratify=y,
+            random_state=self.EI.random_state,
+        )
+        return np.sort(rows)
+
+    def _reset_budget(self, ranking):
+        if self.budget_ is not None:
+            self.budget_ = self.budget_[self.budget_["ranking"] != ranking]
+
+    def _add_to_budget(self, ranking, name, rows, n_rows, importances):
+        """
+        Record the rows and permutation repeats used to rank the features of
+        a modality, or the base predictors of an ensemble method.
+        """
+        _, n_features, n_repeats = importances.shape
+        repeats = int(np.sum(~np.isnan(importances[0])))
+        budget = pd.DataFrame(
+            {
+                "ranking": [ranking],
+                "name": [name],
+                "rows": [rows],
+                "total rows": [n_rows],
+                "features": [n_features],
+                "repeats": [repeats],
+                "full repeats": [n_features * n_repeats],
+            }
+        )
+        budget["fraction of full budget"] = (
+            budget["rows"] * budget["repeats"]
+        ) / (budget["total rows"] * budget["full repeats"])
+        self.budget_ = pd.concat([self.budget_, budget], ignore_index=True)
+
+    def _feature_blocks(self, modality_name, X):
+        """
+        Names and column indices of the features, or feature groups, of a
+        modality ranked in local_feature_rank.
+        """
+        feature_names = self.EI.feature_names_dict[modality_name]
+
+        if isinstance(self.feature_groups, dict):
+            feature_groups = self.feature_groups.get(modality_name)
+        else:
+            feature_groups = self.feature_groups
+
+        if feature_groups is None:
+            return feature_names, None
+
+        if isinstance(feature_groups, str):
+            if feature_groups != "correlation":
+                raise ValueError(
+                    f"Unknown feature_groups {feature_groups}. "
+                    "Use a dict of feature names or 'correlation'."
+                )
+            feature_groups = correlation_feature_groups(
+                X, feature_names, threshold=self.correlation_threshold
+            )
+
+        column = {feature: j for j, feature in enumerate(feature_names)}
+        unknown = [
+            feature
+            for features in feature_groups.values()
+            for feature in features
+            if feature not in column
+        ]
+        if unknown:
+            raise ValueError(
+                f"Features {unknown[:5]} of feature_groups are not in modality "
+                f"{modality_name}."
+            )
+
+        self.feature_groups_[modality_name] = {
+            group: list(features) for group, features in feature_groups.items()
+        }
+        feature_blocks = [
+            [column[feature] for feature in features]
+            for features in feature_groups.values()
+        ]
+        return list(feature_groups), feature_blocks
+
     def local_model_rank(self, meta_predictor_keys):
         """
         Local Model Ranks (LMRs)
@@ -274,12 +705,16 @@ class PermutationInterpreter:
         """
         #  load meta training data from EI training
 
-        meta_X_train, meta_y_train = retrieve_X_y(
-            labelled_data=self.EI.meta_training_data_final[0]
+        meta_X_train = self.EI.meta_training_store_final.X(
+            0, aggregate=self.EI.sampling_aggregation == "mean"
         )
+        meta_y_train = self.EI.meta_training_store_final.labels[0]
 
-        if self.EI.sampling_aggregation == "mean":
-            meta_X_train = meta_X_train.groupby(level=[0, 1], axis=1).mean()
+        n_rows = len(meta_y_train)
+        rows = self._subsample_rows(meta_y_train)
+        meta_X_train = meta_X_train.iloc[rows]
+        meta_y_train = meta_y_train[rows]
+        self._reset_budget("LMR")
 
         #  calculate importance for ensemble models of interest
 
@@ -296,13 +731,13 @@ class PermutationInterpreter:
             desc="Calculating local model ranks",
             bar_format=bar_format,
         ):
-            meta_predictor = pickle.loads(model)
+            meta_predictor = load_model(model)
 
             if ("Mean" in model_name) or ("Median" in model_name):
                 importances_mean = np.ones(len(meta_X_train.columns))
                 importances_std = np.zeros(len(meta_X_train.columns))
 
-            elif model_name == "CES":
+            elif hasattr(meta_predictor, "selected_ensemble"):  # CES, BaggedCES
                 model_selected_freq = []
                 for bp in meta_X_train.columns:
                     model_selected_freq.append(
@@ -312,24 +747,24 @@ class PermutationInterpreter:
                 importances_std = np.ones(len(meta_X_train.columns)) * np.nan
 
             else:
-                needs_proba = hasattr(model, "predict_proba")
-                scorer_ = make_scorer(
-                    self.metric,
-                    greater_is_better=self.metric_greater_is_better,
-                    needs_proba=needs_proba,
-                )
-                pi = permutation_importance(
-                    estimator=meta_predictor,
+                needs_proba = hasattr(meta_predictor, "predict_proba")
+                importances = permutation_importances(
+                    groups=[[meta_predictor]],
                     X=meta_X_train,
                     y=meta_y_train,
+                    metric=self.metric,
+                    greater_is_better=self.metric_greater_is_better,
+                    needs_proba=needs_proba,
                     n_repeats=self.n_repeats,
                     n_jobs=-1,
                     random_state=self.EI.random_state,
-                    scoring=scorer_,
+                    min_repeats=self.min_repeats,
+                    confidence=self.confidence,
                 )
+                self._add_to_budget("LMR", model_name, len(rows), n_rows, importances)
 
-                importances_mean = pi.importances_mean
-                importances_std = pi.importances_std
+                importances_mean = np.nanmean(importances[0], axis=1)
+                importances_std = np.nanstd(importances[0], axis=1)
 
             pi_df = pd.DataFrame(
                 {
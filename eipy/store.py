@@ -0,0 +1,220 @@
+import numpy as np
+import pandas as pd
+
+
+class MetaDataStore:
+    """
+    Columnar store of base predictor predictions for each fold.
+
+    The predictions of a modality are kept as one contiguous array per fold of
+    shape (n_rows, n_base_predictors, n_samples), so adding a modality never
+    copies the modalities already stored. Labels and the row indices of each
+    fold (positions in the data passed to train_base) are kept once. pandas
+    DataFrames with the MultiIndex layout (modality, base predictor, sample)
+    plus a "labels" column are built on demand.
+
+    Attributes
+    ----------
+    labels : list of array
+        Labels of the rows of each fold.
+    row_indices : list of array
+        Row indices of each fold in the original data, or None if unknown.
+    base_predictors : dict
+        Names of the base predictors of each modality, in column order.
+    blocks : dict
+        Prediction arrays of each fold, for each modality.
+    n_samples : int
+        Number of class-balancing samples per base predictor.
+    """
+
+    def __init__(self):
+        self.labels = None
+        self.row_indices = None
+        self.base_predictors = {}
+        self.blocks = {}
+        self.n_samples = None
+        self.version = 0
+        self._frames = None
+        self._X_cache = {}
+
+    @property
+    def n_folds(self):
+        return 0 if self.labels is None else len(self.labels)
+
+    @property
+    def modalities(self):
+        return list(self.blocks)
+
+    def add_modality(
+        self, modality, base_predictors, blocks, labels, row_indices=None
+    ):
+        """
+        Add (or replace) the predictions of a modality.
+
+        Parameters
+        ----------
+        modality : str
+            Name of the modality.
+        base_predictors : list of str
+            Base predictor names, in the order of axis 1 of the blocks.
+        blocks : list of array
+            Arrays of shape (n_rows, n_base_predictors, n_samples) for each fold.
+        labels : list of array
+            Labels of each fold.
+        row_indices : list of array, default=None
+            Row indices of each fold in the original data.
+        """
+        if self.labels is None:
+            self.labels = [np.asarray(fold_labels) for fold_labels in labels]
+            self.row_indices = row_indices
+            self.n_samples = blocks[0].shape[2]
+        else:
+            for fold_labels, new_labels in zip(self.labels, labels):
+                if not np.array_equal(fold_labels, new_labels):
+                    raise ValueError("Labels do not match across modalities.")
+
+        self.base_predictors[modality] = list(base_predictors)
+        self.blocks[modality] = [np.ascontiguousarray(block) for block in blocks]
+        self._modified()
+        return self
+
+    def add_base_predictors(self, modality, base_predictors, blocks):
+        """
+        Add the predictions of further base predictors to a modality already
+        in the store. Their columns follow those of the existing base
+        predictors.
+
+        Parameters
+        ----------
+        modality : str
+            Name of the modality.
+        base_predictors : list of str
+            Names of the new base predictors, in the order of axis 1 of the
+            blocks.
+        blocks : list of array
+            Arrays of shape (n_rows, n_new_base_predictors, n_samples) for each
+            fold, with rows in the same order as the existing predictions.
+        """
+        if modality not in self.blocks:
+            raise ValueError(f"{modality} is not in the store.")
+        if set(base_predictors).intersection(self.base_predictors[modality]):
+            raise ValueError(f"Base predictors already stored for {modality}.")
+
+        self.base_predictors[modality] = self.base_predictors[modality] + list(
+            base_predictors
+        )
+        self.blocks[modality] = [
+            np.concatenate([block, new_block], axis=1)
+            for block, new_block in zip(self.blocks[modality], blocks)
+        ]
+        self._modified()
+        return self
+
+    def columns(self, aggregate=False):
+        """
+        MultiIndex of the prediction columns, in storage order. If aggregate,
+        the sample level is dropped.
+        """
+        if aggregate:
+            return pd.MultiIndex.from_tuples(
+                [
+                    (modality, base_predictor)
+                    for modality, names in self.base_predictors.items()
+                    for base_predictor in names
+                ],
+                names=["modality", "base predictor"],
+            )
+        return pd.MultiIndex.from_tuples(
+            [
+                (modality, base_predictor, sample)
+                for modality, names in self.base_predictors.items()
+                for base_predictor in names
+                for sample in range(self.n_samples)
+            ],
+            names=["modality", "base predictor", "sample"],
+        )
+
+    def array(self, fold, aggregate=False):
+        """
+        Predictions of a fold as a (n_rows, n_columns) array. If aggregate, the
+        samples of each base predictor are averaged.
+        """
+        blocks = [self.blocks[modality][fold] for modality in self.blocks]
+        if aggregate:
+            blocks = [block.mean(axis=2) for block in blocks]
+        return np.hstack([block.reshape(len(block), -1) for block in blocks])
+
+    def X(self, fold, aggregate=False):
+        """
+        Predictions of a fold as a DataFrame. If aggregate, samples of each base
+        predictor are averaged and columns are sorted by (modality, base
+        predictor), as with groupby(level=[0, 1], axis=1).mean().
+
+        The DataFrame is computed once and reused until the store is modified,
+        so it must not be changed in place.
+        """
+        key = (fold, aggregate)
+        if key not in self._X_cache:
+            self._X_cache[key] = self._build_X(fold, aggregate=aggregate)
+        return self._X_cache[key]
+
+    def _build_X(self, fold, aggregate=False):
+        X = pd.DataFrame(
+            self.array(fold, aggregate=aggregate), columns=self.columns(aggregate)
+        )
+        if aggregate:
+            X = X.iloc[:, sorted(range(X.shape[1]), key=X.columns.__getitem__)]
+        return X
+
+    def frame(self, fold):
+        """
+        Labelled MultiIndex DataFrame of a fold.
+        """
+        frame = self._build_X(fold)
+        frame["labels"] = self.labels[fold]
+        return frame
+
+    def frames(self):
+        """
+        Labelled MultiIndex DataFrames of all folds. Built on first access and
+        reused until the store is modified.
+        """
+        if self._frames is None:
+            self._frames = [self.frame(fold) for fold in range(self.n_folds)]
+        return self._frames
+
+    def _modified(self):
+        self.version += 1
+        self._frames = None
+        self._X_cache = {}
+
+    @classmethod
+    def from_frames(cls, frames):
+        """
+        Build a store from labelled MultiIndex DataFrames, e.g. the
+        meta_training_data of EnsembleIntegration objects saved before the
+        store existed.
+        """
+        if frames is None:
+            return None
+        store = cls()
+        labels = [np.ravel(frame["labels"]) for frame in frames]
+        predictions = [frame.drop(columns=["labels"], level=0) for frame in frames]
+        for modality in predictions[0].columns.unique(level=0):
+            columns = predictions[0][modality].columns
+            base_predictors = list(columns.unique(level=0))
+            n_samples = len(columns.unique(level=1))
+            blocks = [
+                frame[modality]
+                .to_numpy()
+                .reshape(len(frame), len(base_predictors), n_samples)
+                for frame in predictions
+            ]
+            store.add_modality(modality, base_predictors, blocks, labels)
+        return store
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_frames"] = None
+        state["_X_cache"] = {}
+        return state
@@ -1,15 +1,19 @@
 import pandas as pd
 import numpy as np
 import random
+import pickle
+import zlib
+import lzma
+import os
+from joblib import Parallel, delayed
+from eipy.store import MetaDataStore
+from eipy.artifact import ModelFile
 from sklearn.metrics import (
-    roc_auc_score,
     precision_recall_curve,
     matthews_corrcoef,
     precision_recall_fscore_support,
     make_scorer,
 )
-from imblearn.under_sampling import RandomUnderSampler
-from imblearn.over_sampling import RandomOverSampler
 
 # from tensorflow.keras.backend import clear_session
 import warnings
@@ -66,16 +70,88 @@ class dummy_cv:
         return self.n_splits
 
 
-def create_base_summary(meta_test_dataframe):
-    labels = pd.concat([df["labels"] for df in meta_test_dataframe])
-    meta_test_averaged_samples = pd.concat(
-        [
-            df.drop(columns=["labels"], level=0).groupby(level=(0, 1), axis=1).mean()
-            for df in meta_test_dataframe
-        ]
-    )
+def create_base_summary(meta_test_dataframe, n_jobs=1, **kwargs):
+    if isinstance(meta_test_dataframe, MetaDataStore):
+        folds = range(meta_test_dataframe.n_folds)
+        meta_test_averaged_samples = pd.concat(
+            [meta_test_dataframe.X(fold, aggregate=True) for fold in folds],
+            ignore_index=True,
+        )
+        labels = np.concatenate([meta_test_dataframe.labels[fold] for fold in folds])
+    else:
+        labels = pd.concat([df["labels"] for df in meta_test_dataframe])
+        meta_test_averaged_samples = pd.concat(
+            [
+                df.drop(columns=["labels"], level=0)
+                .groupby(level=(0, 1), axis=1)
+                .mean()
+                for df in meta_test_dataframe
+            ]
+        )
     meta_test_averaged_samples["labels"] = labels
-    return metric_threshold_dataframes(meta_test_averaged_samples)
+    return metric_threshold_dataframes(
+        meta_test_averaged_samples, n_jobs=n_jobs, **kwargs
+    )
+
+
+_LZMA_MAGIC = b"\xfd7zXZ\x00"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def dump_model(model, compression=None, level=None, protocol=None):
+    """
+    Serialize a model for final_models with the given pickle protocol,
+    compressed with 'zlib', 'lzma' or 'zstd' (requires the zstandard package)
+    at the given level, or not compressed if compression is None.
+    """
+    model_bytes = pickle.dumps(model, protocol=protocol)
+    if compression is None:
+        return model_bytes
+    elif compression == "zlib":
+        return zlib.compress(model_bytes, -1 if level is None else level)
+    elif compression == "lzma":
+        return lzma.compress(model_bytes, preset=level)
+    elif compression == "zstd":
+        level = 3 if level is None else level
+        return _zstandard().ZstdCompressor(level=level).compress(model_bytes)
+    else:
+        raise ValueError(f"Unknown compression: {compression}")
+
+
+def load_model(model_bytes):
+    """
+    Deserialize a model stored in final_models, reading it from disk first if
+    it was loaded lazily from an artifact directory. The compression used by
+    dump_model is detected from the leading bytes.
+    """
+    if isinstance(model_bytes, ModelFile):
+        model_bytes = model_bytes.read()
+    if model_bytes.startswith(_LZMA_MAGIC):
+        model_bytes = lzma.decompress(model_bytes)
+    elif model_bytes.startswith(_ZSTD_MAGIC):
+        model_bytes = _zstandard().ZstdDecompressor().decompress(model_bytes)
+    elif model_bytes[:1] == b"\x78":  # zlib header; pickles start with b"\x80"
+        model_bytes = zlib.decompress(model_bytes)
+    return pickle.loads(model_bytes)
+
+
+def model_size(model_bytes):
+    """
+    Size in bytes of a model stored in final_models.
+    """
+    if isinstance(model_bytes, ModelFile):
+        return os.path.getsize(model_bytes.path)
+    return len(model_bytes)
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError(
+            "zstd compression requires the zstandard package: pip install zstandard"
+        ) from e
+    return zstandard
 
 
 def safe_predict_proba(model, X):  # uses predict_proba method where possible
@@ -86,44 +162,44 @@ def safe_predict_proba(model, X):  # uses predict_proba method where possible
     return y_pred
 
 
-def score_threshold_vectors(df, labels):
-    scores_dict = {}
-    for column in df.columns:
-        column_temp = df[column]
-        metrics = scores(labels, column_temp)
-        metric_names = list(metrics.keys())
-        for m in metric_names:
-            if not (m in scores_dict):
-                scores_dict[m] = [metrics[m]]
-            else:
-                scores_dict[m].append(metrics[m])
-    return scores_dict
-
-
-# def score_vector_split(list_of_tuples): # don't think this is needed anymore
-#     score = []
-#     threshold = []
-#     for score_tuple in list_of_tuples:
-#         score.append(score_tuple[0])
-#         threshold.append(score_tuple[1])
-#     return score, threshold
-
+def score_threshold_vectors(df, labels, n_jobs=1, n_bins=None):
+    metrics, thresholds = score_matrix(
+        labels, df.to_numpy(dtype=float), n_jobs=n_jobs, n_bins=n_bins
+    )
+    return {
+        m: list(zip(metrics[i], thresholds[i])) for i, m in enumerate(metric_names)
+    }
 
-def metrics_per_fold(df, labels):
-    scores_dict = score_threshold_vectors(df, labels)
 
-    metrics_df = pd.DataFrame(columns=df.columns)
-    thresholds_df = pd.DataFrame(columns=df.columns)
-    for k, val in scores_dict.items():
-        metrics_df.loc[k], thresholds_df.loc[k] = list(zip(*val))
+def metrics_per_fold(df, labels, n_jobs=1, n_bins=None):
+    metrics, thresholds = score_matrix(
+        labels, df.to_numpy(dtype=float), n_jobs=n_jobs, n_bins=n_bins
+    )
+    metrics_df = pd.DataFrame(metrics, index=metric_names, columns=df.columns)
+    thresholds_df = pd.DataFrame(thresholds, index=metric_names, columns=df.columns)
     return metrics_df, thresholds_df
 
 
-def metric_threshold_dataframes(df):
+def metric_threshold_dataframes(
+    df, n_jobs=1, n_bins=None, n_bootstrap=None, ci_level=0.95, random_state=None
+):
     data = df.drop(["labels"], axis=1)
     labels = df["labels"]
     df_dict = {}
-    df_dict["metrics"], df_dict["thresholds"] = metrics_per_fold(data, labels)
+    df_dict["metrics"], df_dict["thresholds"] = metrics_per_fold(
+        data, labels, n_jobs=n_jobs, n_bins=n_bins
+    )
+    if n_bootstrap:
+        lower, upper = bootstrap_metrics(
+            labels,
+            data.to_numpy(dtype=float),
+            n_bootstrap=n_bootstrap,
+            ci_level=ci_level,
+            random_state=random_state,
+            n_jobs=n_jobs,
+        )
+        df_dict["lower"] = pd.DataFrame(lower, index=metric_names, columns=data.columns)
+        df_dict["upper"] = pd.DataFrame(upper, index=metric_names, columns=data.columns)
     return df_dict
 
 
@@ -235,35 +311,493 @@ def matthews_max_score(y_true, y_pred):
     return max_mcc, max_mcc_threshold
 
 
-def scores(y_true, y_pred, beta=1, metric_to_maximise="fscore", verbose=0):
-    if np.bincount(y_true)[0] < np.bincount(y_true)[1]:
-        minor_class = 0
-        major_class = 1
+def _group_ends(values):
+    """
+    Mask the last element of each run of tied values along axis 0.
+    """
+    ends = np.ones(values.shape, dtype=bool)
+    ends[:-1] = values[1:] != values[:-1]
+    return ends
+
+
+def _threshold_counts(scores_desc, positives_desc, weights_desc=None):
+    """
+    Cumulative true/false positive counts as the threshold is lowered through
+    scores sorted in descending order. Only rows flagged in the returned mask
+    (the last row of each group of tied scores) are valid thresholds. Optional
+    weights (e.g. bootstrap multiplicities) scale the contribution of each row.
+    """
+    if weights_desc is None:
+        tps = np.cumsum(positives_desc, axis=0, dtype=np.float64)
+        n_predicted = np.arange(1, scores_desc.shape[0] + 1, dtype=np.float64)
+        fps = n_predicted.reshape((-1,) + (1,) * (tps.ndim - 1)) - tps
     else:
-        minor_class = 1
-        major_class = 0
-
-    # fmax = fmax_score(y_true, y_pred, beta=1)
-    f_measure_minor = fmeasure_score(y_true, y_pred, pos_label=minor_class)
-    # f_measure_minor_0 = fmeasure_score(y_true, y_pred, pos_label=minor_class,
-    # thres=f_measure_minor['thres'])
-    # print('without thres', f_measure_minor)
-    # print('with thres', f_measure_minor_0)
-    f_measure_major = fmeasure_score(
-        y_true, y_pred, pos_label=major_class, thres=1 - f_measure_minor["thres"]
+        tps = np.cumsum(weights_desc * positives_desc, axis=0, dtype=np.float64)
+        fps = np.cumsum(weights_desc, axis=0, dtype=np.float64) - tps
+    return tps, fps, np.broadcast_to(_group_ends(scores_desc), tps.shape)
+
+
+def _last_true(mask):
+    """
+    Index of the last True entry along axis 0, i.e. the lowest threshold.
+    """
+    return mask.shape[0] - 1 - np.argmax(mask[::-1], axis=0)
+
+
+def _fmax_from_counts(tps, fps, ends, beta=1.0):
+    """
+    Fmax over all thresholds, breaking ties like fmeasure_score: most balanced
+    precision and recall first, then the lowest threshold.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = tps / (tps + fps)
+        recall = tps / tps[-1]
+        fs = (1 + beta**2) * (precision * recall) / ((beta**2 * precision) + recall)
+    fs = np.where(ends, fs, np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        fmax = np.nanmax(fs, axis=0)
+    pr_diff = np.where(fs == fmax, np.abs(precision - recall), np.inf)
+    index = _last_true(pr_diff == pr_diff.min(axis=0))
+    return fmax, index
+
+
+def _f_complement(tp, fp, n_pos, n_neg, beta=1.0):
+    """
+    F-measure of the negative class when everything not predicted positive at
+    a threshold is predicted negative (zero_division=0).
+    """
+    true_pos = n_neg - fp
+    false_pos = n_pos - tp
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.nan_to_num(true_pos / (true_pos + false_pos))
+        recall = np.nan_to_num(true_pos / n_neg)
+        denom = beta**2 * precision + recall
+        fs = (1 + beta**2) * precision * recall / np.where(denom == 0, 1, denom)
+    return fs
+
+
+def _max_mcc_from_counts(tps, fps, ends):
+    """
+    Maximum Matthews correlation coefficient over all thresholds. Ties are
+    resolved towards the lowest threshold.
+    """
+    fns = tps[-1] - tps
+    tns = fps[-1] - fps
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mcc = (tps * tns - fps * fns) / np.sqrt(
+            (tps + fps) * (tps + fns) * (tns + fps) * (tns + fns)
+        )
+    mcc = np.where(ends, np.nan_to_num(mcc, nan=0.0), -np.inf)
+    max_mcc = mcc.max(axis=0)
+    return max_mcc, _last_true(mcc == max_mcc)
+
+
+def _auc_from_counts(tps, fps, ends):
+    """
+    Area under the ROC curve by the trapezoidal rule over tied-score groups.
+    """
+    n = tps.shape[0]
+    positions = np.arange(n).reshape((-1,) + (1,) * (tps.ndim - 1))
+    last_end = np.maximum.accumulate(np.where(ends, positions, -1), axis=0)
+    previous_end = np.concatenate([np.full_like(last_end[:1], -1), last_end[:-1]])
+    tp_prev = np.where(
+        previous_end < 0, 0, np.take_along_axis(tps, previous_end.clip(0), axis=0)
+    )
+    fp_prev = np.where(
+        previous_end < 0, 0, np.take_along_axis(fps, previous_end.clip(0), axis=0)
     )
+    area = np.where(ends, (fps - fp_prev) * (tps + tp_prev) / 2, 0).sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return area / (tps[-1] * fps[-1])
 
-    max_mcc = matthews_max_score(y_true, y_pred)
 
-    auc = roc_auc_score(y_true, y_pred)
+metric_names = ["fmax (minority)", "f (majority)", "AUC", "max MCC"]
 
-    scores_threshold_dict = {
-        "fmax (minority)": (f_measure_minor["F"], f_measure_minor["thres"]),
-        "f (majority)": (f_measure_major["F"], f_measure_minor["thres"]),
-        "AUC": (auc, np.nan),
-        "max MCC": max_mcc,
+
+def _metrics_from_curves(positive_curve, minority_curve, beta=1.0):
+    """
+    Metrics from (thresholds, tps, fps, ends) curves ordered by decreasing
+    threshold, with class 1 and with the minority class as the positive class.
+    Returns (metrics, thresholds) arrays of shape (len(metric_names), n_columns).
+    """
+    thresholds, tps, fps, ends = positive_curve
+    columns = np.arange(tps.shape[1])
+    auc = _auc_from_counts(tps, fps, ends)
+    max_mcc, mcc_index = _max_mcc_from_counts(tps, fps, ends)
+    mcc_threshold = np.broadcast_to(thresholds, tps.shape)[mcc_index, columns]
+
+    thresholds, tps, fps, ends = minority_curve
+    fmax, f_index = _fmax_from_counts(tps, fps, ends, beta=beta)
+    f_major = _f_complement(
+        tps[f_index, columns], fps[f_index, columns], tps[-1], fps[-1]
+    )
+    f_threshold = np.broadcast_to(thresholds, tps.shape)[f_index, columns]
+
+    metrics = np.stack([fmax, f_major, auc, max_mcc])
+    thresholds = np.stack(
+        [f_threshold, f_threshold, np.full(len(columns), np.nan), mcc_threshold]
+    )
+    return metrics, thresholds
+
+
+def _score_columns(y_true, y_pred, beta=1.0):
+    """
+    Score every column of a (n_samples, n_columns) prediction matrix against
+    shared labels.
+    """
+    class_counts = np.bincount(y_true, minlength=2)
+    minor_class = 0 if class_counts[0] < class_counts[1] else 1
+
+    order = np.argsort(y_pred, axis=0, kind="mergesort")
+    pred_sorted = np.take_along_axis(y_pred, order, axis=0)
+    true_sorted = y_true[order]
+
+    # class 1 as positive, lowering the threshold from the highest prediction
+    pred_desc = pred_sorted[::-1]
+    positive_curve = (pred_desc,) + _threshold_counts(pred_desc, true_sorted[::-1])
+
+    # minority class as positive, scored on 1 - y_pred when it is class 0
+    if minor_class == 0:
+        minor_desc = 1 - pred_sorted
+        minority_curve = (minor_desc,) + _threshold_counts(minor_desc, 1 - true_sorted)
+    else:
+        minority_curve = positive_curve
+
+    return _metrics_from_curves(positive_curve, minority_curve, beta=beta)
+
+
+def _bootstrap_block(y_true, y_pred, orders, seed, size, beta=1.0):
+    """
+    Metrics of every column of y_pred on one block of bootstrap resamples.
+
+    Each resample is represented by the number of times every row was drawn.
+    These weights are drawn once for the block and shared by all columns;
+    each column only reorders them by its sorted predictions (orders), so
+    resamples are scored together as weighted cumulative counts. Returns an
+    array of shape (size, len(metric_names), n_columns).
+    """
+    n_samples = len(y_true)
+
+    # rows drawn with replacement, as an index matrix shared by all columns
+    rng = np.random.default_rng(seed)
+    indices = rng.integers(0, n_samples, size=(size, n_samples))
+    indices += n_samples * np.arange(size)[:, None]
+    weights = np.bincount(indices.ravel(), minlength=size * n_samples)
+    weights = weights.reshape(size, n_samples).T
+
+    results = []
+    for pred, order in zip(y_pred.T, orders.T):
+        pred_sorted = pred[order]
+        true_sorted = y_true[order][:, None]
+        pred_desc = pred_sorted[::-1, None]
+        minor_desc = 1 - pred_sorted[:, None]
+        weights_sorted = weights[order]
+
+        positive_curve = (pred_desc,) + _threshold_counts(
+            pred_desc, true_sorted[::-1], weights_sorted[::-1]
+        )
+        negative_curve = (minor_desc,) + _threshold_counts(
+            minor_desc, 1 - true_sorted, weights_sorted
+        )
+        class_counts = positive_curve[2][-1] + positive_curve[1][-1]
+        n_positives = positive_curve[1][-1]
+        minor_class = np.where(class_counts - n_positives < n_positives, 0, 1)
+        if (minor_class == 1).all():
+            minority_curve = positive_curve
+        elif (minor_class == 0).all():
+            minority_curve = negative_curve
+        else:
+            minority_curve = tuple(
+                np.where(minor_class == 0, negative, positive)
+                for positive, negative in zip(positive_curve, negative_curve)
+            )
+        metrics, _ = _metrics_from_curves(positive_curve, minority_curve, beta=beta)
+        results.append(metrics.T)
+    return np.stack(results, axis=-1)
+
+
+def bootstrap_metrics(
+    y_true,
+    y_pred,
+    n_bootstrap=1000,
+    ci_level=0.95,
+    random_state=None,
+    n_jobs=1,
+    block_size=None,
+    beta=1.0,
+):
+    """
+    Percentile bootstrap confidence intervals for the metrics of score_matrix.
+
+    All columns are evaluated on the same resamples of rows, so intervals of
+    different columns are paired.
+
+    Parameters
+    ----------
+    y_true : array of shape (n_samples,)
+        Binary class labels.
+    y_pred : array of shape (n_samples,) or (n_samples, n_columns)
+        Predicted probabilities of the positive class.
+    n_bootstrap : int, default=1000
+        Number of bootstrap resamples.
+    ci_level : float, default=0.95
+        Confidence level of the intervals.
+    random_state : int, default=None
+        Seed for drawing the resamples.
+    n_jobs : int, default=1
+        Number of joblib workers; blocks of resamples are distributed across
+        workers.
+    block_size : int, default=None
+        Number of resamples scored together. Defaults to a block of roughly
+        four million weights.
+    beta : float, default=1.0
+        Weight of recall in the minority class F-measure.
+
+    Returns
+    -------
+    lower : array of shape (len(metric_names), n_columns)
+        Lower bounds of the confidence intervals.
+    upper : array of shape (len(metric_names), n_columns)
+        Upper bounds of the confidence intervals.
+    """
+    y_true = np.asarray(y_true, dtype=int)
+    y_pred = np.asarray(y_pred, dtype=np.float64)
+    if y_pred.ndim == 1:
+        y_pred = y_pred[:, None]
+
+    n_samples, n_columns = y_pred.shape
+    if block_size is None:
+        block_size = max(1, 2**22 // max(n_samples, 1))
+    n_resamples = [
+        min(block_size, n_bootstrap - start)
+        for start in range(0, n_bootstrap, block_size)
+    ]
+    seeds = np.random.SeedSequence(random_state).spawn(len(n_resamples))
+    orders = np.argsort(y_pred, axis=0, kind="mergesort")
+
+    with Parallel(n_jobs=n_jobs) as parallel:
+        resampled = parallel(
+            delayed(_bootstrap_block)(y_true, y_pred, orders, seed, size, beta=beta)
+            for seed, size in zip(seeds, n_resamples)
+        )
+    resampled = np.concatenate(resampled)  # (resample, metric, column)
+
+    alpha = (1 - ci_level) / 2
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        lower, upper = np.nanquantile(resampled, [alpha, 1 - alpha], axis=0)
+    return lower, upper
+
+
+class BinnedMetrics:
+    """
+    Mergeable histogram of predictions for approximate threshold metrics.
+
+    Predictions are counted into n_bins fixed-width probability bins per class
+    and column, so memory does not grow with the number of predictions. Counts
+    can be updated chunk by chunk and merged across folds or workers, and the
+    metrics of score_matrix are then computed from the bin counts.
+
+    Thresholds are restricted to bin edges. Each reported score is exact for
+    its reported threshold, so fmax and max MCC can only be underestimated.
+    The error is bounded by (see error_bounds):
+
+    - fmax (minority): fmax - fmax_binned <= max_b n_b / (beta**2 * n_minority),
+      where n_b is the number of predictions in bin b.
+    - AUC: |AUC - AUC_binned| <= sum_b n1_b * n0_b / (2 * n1 * n0), as
+      positive/negative pairs sharing a bin are counted as ties.
+    - max MCC has no closed-form bound; it converges to the exact value as
+      the bin width shrinks.
+
+    Parameters
+    ----------
+    n_bins : int, default=1000
+        Number of equal-width bins on [0, 1]. Predictions outside [0, 1] are
+        clipped into the first or last bin.
+    """
+
+    def __init__(self, n_bins=1000):
+        self.n_bins = n_bins
+        self.counts = None  # (class, bin, column)
+
+    def update(self, y_true, y_pred):
+        """
+        Add a chunk of labels and predictions of shape (n_samples,) or
+        (n_samples, n_columns).
+        """
+        y_true = np.asarray(y_true, dtype=int)
+        y_pred = np.asarray(y_pred, dtype=np.float64)
+        if y_pred.ndim == 1:
+            y_pred = y_pred[:, None]
+        n_columns = y_pred.shape[1]
+
+        if self.counts is None:
+            self.counts = np.zeros((2, self.n_bins, n_columns), dtype=np.int64)
+        elif self.counts.shape[2] != n_columns:
+            raise ValueError(
+                f"Expected {self.counts.shape[2]} columns, got {n_columns}."
+            )
+
+        bins = np.clip(np.floor(y_pred * self.n_bins), 0, self.n_bins - 1)
+        bins = bins.astype(np.int64) + self.n_bins * np.arange(n_columns)
+        for label in (0, 1):
+            self.counts[label] += np.bincount(
+                bins[y_true == label].ravel(), minlength=self.n_bins * n_columns
+            ).reshape(n_columns, self.n_bins).T
+        return self
+
+    def merge(self, other):
+        """
+        Add the counts of another BinnedMetrics with the same bins.
+        """
+        if other.n_bins != self.n_bins:
+            raise ValueError("Cannot merge BinnedMetrics with different n_bins.")
+        if other.counts is not None:
+            if self.counts is None:
+                self.counts = other.counts.copy()
+            else:
+                self.counts = self.counts + other.counts
+        return self
+
+    def _checked_counts(self):
+        if self.counts is None:
+            raise ValueError(
+                "BinnedMetrics has no counts yet. Call update or merge first."
+            )
+        return self.counts
+
+    def score(self, beta=1.0):
+        """
+        Metrics and thresholds from the bin counts, as returned by score_matrix.
+        """
+        negatives, positives = self._checked_counts().astype(np.float64)
+        n_negatives, n_positives = negatives.sum(axis=0), positives.sum(axis=0)
+        edges = np.arange(self.n_bins + 1) / self.n_bins
+        nonempty = (negatives + positives) > 0
+
+        # class 1 as positive, predicted positive from the lower edge of a bin
+        positive_curve = (
+            edges[-2::-1, None],
+            np.cumsum(positives[::-1], axis=0),
+            np.cumsum(negatives[::-1], axis=0),
+            nonempty[::-1],
+        )
+        # class 0 as positive on 1 - y_pred, from the upper edge of a bin
+        negative_curve = (
+            1 - edges[1:, None],
+            np.cumsum(negatives, axis=0),
+            np.cumsum(positives, axis=0),
+            nonempty,
+        )
+
+        minor_class = np.where(n_negatives < n_positives, 0, 1)
+        if (minor_class == 1).all():
+            minority_curve = positive_curve
+        elif (minor_class == 0).all():
+            minority_curve = negative_curve
+        else:
+            minority_curve = tuple(
+                np.where(minor_class == 0, negative, positive)
+                for positive, negative in zip(positive_curve, negative_curve)
+            )
+
+        return _metrics_from_curves(positive_curve, minority_curve, beta=beta)
+
+    def error_bounds(self, beta=1.0):
+        """
+        Upper bounds on the approximation error of fmax (minority) and AUC for
+        each column.
+        """
+        negatives, positives = self._checked_counts().astype(np.float64)
+        n_negatives, n_positives = negatives.sum(axis=0), positives.sum(axis=0)
+        n_minority = np.minimum(n_negatives, n_positives)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return {
+                "fmax (minority)": (negatives + positives).max(axis=0)
+                / (beta**2 * n_minority),
+                "AUC": (negatives * positives).sum(axis=0)
+                / (2 * n_negatives * n_positives),
+            }
+
+
+def score_matrix(y_true, y_pred, beta=1.0, n_jobs=1, block_size=None, n_bins=None):
+    """
+    Compute fmax (minority), f (majority), AUC and max MCC for every column of
+    a prediction matrix.
+
+    Each column is sorted once and the cumulative confusion counts at every
+    distinct threshold are used for all metrics, so max MCC is exact rather
+    than evaluated on a fixed grid. Thresholds follow the conventions of
+    fmeasure_score (fmax of the minority class, expressed in 1 - y_pred when
+    the minority class is 0) and of matthews_max_score (y_pred >= threshold).
+
+    Parameters
+    ----------
+    y_true : array of shape (n_samples,)
+        Binary class labels.
+    y_pred : array of shape (n_samples,) or (n_samples, n_columns)
+        Predicted probabilities of the positive class.
+    beta : float, default=1.0
+        Weight of recall in the minority class F-measure.
+    n_jobs : int, default=1
+        Number of joblib workers used to score blocks of columns.
+    block_size : int, default=None
+        Number of columns scored together. Defaults to a block of roughly
+        four million predictions.
+    n_bins : int, default=None
+        If given, approximate the metrics from a histogram of n_bins
+        fixed-width probability bins instead of sorting. See BinnedMetrics.
+
+    Returns
+    -------
+    metrics : array of shape (len(metric_names), n_columns)
+        Scores, in the order of metric_names.
+    thresholds : array of shape (len(metric_names), n_columns)
+        Thresholds at which the scores were attained (nan for AUC).
+    """
+    y_true = np.asarray(y_true, dtype=int)
+    y_pred = np.asarray(y_pred, dtype=np.float64)
+    if y_pred.ndim == 1:
+        y_pred = y_pred[:, None]
+
+    if n_bins is not None:
+        return BinnedMetrics(n_bins=n_bins).update(y_true, y_pred).score(beta=beta)
+
+    n_samples, n_columns = y_pred.shape
+    if block_size is None:
+        block_size = max(1, 2**22 // max(n_samples, 1))
+    blocks = [
+        slice(start, start + block_size) for start in range(0, n_columns, block_size)
+    ]
+
+    if n_jobs == 1 or len(blocks) == 1:
+        results = [_score_columns(y_true, y_pred[:, b], beta=beta) for b in blocks]
+    else:
+        results = Parallel(n_jobs=n_jobs)(
+            delayed(_score_columns)(y_true, y_pred[:, b], beta=beta) for b in blocks
+        )
+
+    metrics, thresholds = zip(*results)
+    return np.hstack(metrics), np.hstack(thresholds)
+
+
+def threshold_metrics(y_true, y_pred, beta=1.0, n_bins=None):
+    """
+    Dictionary of (score, threshold) tuples for a single prediction vector.
+    See score_matrix.
+    """
+    metrics, thresholds = score_matrix(y_true, y_pred, beta=beta, n_bins=n_bins)
+    return {
+        name: (metrics[i, 0], thresholds[i, 0]) for i, name in enumerate(metric_names)
     }  # dictionary of (score, threshold)
 
+
+def scores(
+    y_true, y_pred, beta=1, metric_to_maximise="fscore", verbose=0, n_bins=None
+):
+    scores_threshold_dict = threshold_metrics(y_true, y_pred, n_bins=n_bins)
+
     if verbose > 0:
         for metric_name, score in scores_threshold_dict.items():
             print(metric_name + ": ", score[0])
@@ -297,41 +831,48 @@ def random_integers(n_integers=1, seed=42):
 
 
 def sample(X, y, strategy, random_state):
+    indices = sample_indices(y, strategy, random_state)
+    return X[indices], y[indices]
+
+
+def sample_indices(y, strategy, random_state=None):
+    """
+    Row indices of a class-balanced sample of y, drawn with NumPy.
+
+    'undersampling' draws rows of every class without replacement down to the
+    size of the smallest class, 'oversampling' keeps every row and draws rows
+    with replacement up to the size of the largest class, and 'hybrid' brings
+    every class to half the number of rows. Rows are ordered by class. The
+    sample only depends on y, strategy and random_state, which seeds
+    numpy.random.default_rng.
+    """
+    y = np.asarray(y)
+
     if strategy is None:
-        X_resampled, y_resampled = X, y
-    elif strategy == "undersampling":  # define sampler
-        sampler = RandomUnderSampler(random_state=random_state)
+        return np.arange(len(y))
+
+    classes, counts = np.unique(y, return_counts=True)
+    if strategy == "undersampling":
+        target = counts.min()
     elif strategy == "oversampling":
-        sampler = RandomOverSampler(random_state=random_state)
+        target = counts.max()
     elif strategy == "hybrid":
-        y_pos = float(sum(y == 1))
-        y_total = y.shape[0]
-        if (y_pos / y_total) < 0.5:
-            y_min_count = y_pos
-            y_maj_count = y_total - y_pos
-            maj_class = 0
+        target = len(y) // 2
+    else:
+        raise ValueError(f"Unknown sampling strategy: {strategy}")
+
+    rng = np.random.default_rng(random_state)
+    blocks = []
+    for label, count in zip(classes, counts):
+        rows = np.flatnonzero(y == label)
+        if target < count:
+            # without replacement
+            blocks.append(rng.permutation(rows)[:target])
         else:
-            y_maj_count = y_pos
-            y_min_count = y_total - y_pos
-            maj_class = 1
-        rus = RandomUnderSampler(
-            random_state=random_state, sampling_strategy=y_min_count / (y_total / 2)
-        )
-        ros = RandomOverSampler(
-            random_state=random_state, sampling_strategy=(y_total / 2) / y_maj_count
-        )
-        X_maj, y_maj = rus.fit_resample(X=X, y=y)
-        X_maj = X_maj[y_maj == maj_class]
-        y_maj = y_maj[y_maj == maj_class]
-        X_min, y_min = ros.fit_resample(X=X, y=y)
-        X_min = X_min[y_min != maj_class]
-        y_min = y_min[y_min != maj_class]
-        X_resampled = np.concatenate([X_maj, X_min])
-        y_resampled = np.concatenate([y_maj, y_min])
-
-    if (strategy == "undersampling") or (strategy == "oversampling"):
-        X_resampled, y_resampled = sampler.fit_resample(X=X, y=y)
-    return X_resampled, y_resampled
+            # every row, then the remainder with replacement
+            blocks.append(rows)
+            blocks.append(rows[rng.integers(0, count, size=target - count)])
+    return np.concatenate(blocks)
 
 
 def retrieve_X_y(labelled_data):
@@ -385,6 +926,26 @@ def f_minority_score(y_true, y_pred):
     return fmeasure_score(y_true, y_pred, pos_label=minor_class)["F"]
 
 
+def f_minority_score_columns(y_true, y_pred):
+    """
+    f_minority_score of every column of a (n_samples, n_columns) prediction
+    matrix, computed together from cumulative counts.
+    """
+    y_true = np.asarray(y_true, dtype=int)
+    y_pred = np.asarray(y_pred, dtype=np.float64)
+    minor_class = 0 if np.bincount(y_true)[0] < np.bincount(y_true)[1] else 1
+
+    order = np.argsort(y_pred, axis=0, kind="mergesort")
+    pred_sorted = np.take_along_axis(y_pred, order, axis=0)
+    true_sorted = y_true[order]
+    if minor_class == 0:
+        tps, fps, ends = _threshold_counts(1 - pred_sorted, 1 - true_sorted)
+    else:
+        tps, fps, ends = _threshold_counts(pred_sorted[::-1], true_sorted[::-1])
+    fmax, _ = _fmax_from_counts(tps, fps, ends)
+    return fmax
+
+
 def generate_scorer_by_model(score_func, model, greater_is_better):
     needs_proba = False
     if hasattr(model, "predict_proba"):
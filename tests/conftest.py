@@ -0,0 +1,48 @@
+import pytest
+
+
+@pytest.fixture
+def data():
+    """
+    Small imbalanced binary classification data set, (X, y).
+    """
+
+    from sklearn.datasets import make_classification
+
+    return make_classification(
+        n_samples=120, n_features=6, weights=[0.7, 0.3], random_state=0
+    )
+
+
+@pytest.fixture
+def make_ei():
+    """
+    Factory of small EnsembleIntegration objects. Keyword arguments override
+    the defaults. If X_dict is given, base predictors are trained on each of
+    its modalities, and meta predictors are trained if meta_predictors is
+    given.
+    """
+
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.naive_bayes import GaussianNB
+    from eipy.ei import EnsembleIntegration
+
+    def make(X_dict=None, y=None, meta_predictors=None, **kwargs):
+        params = dict(
+            base_predictors={"LR": LogisticRegression(), "NB": GaussianNB()},
+            k_outer=2,
+            k_inner=2,
+            random_state=0,
+            model_building=True,
+            verbose=0,
+        )
+        params.update(kwargs)
+        EI = EnsembleIntegration(**params)
+
+        for modality, X in (X_dict or {}).items():
+            EI.train_base(X, y, modality=modality)
+        if meta_predictors is not None:
+            EI.train_meta(meta_predictors=meta_predictors)
+        return EI
+
+    return make
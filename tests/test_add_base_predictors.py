@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+
+def test_add_base_predictors_matches_training_together(make_ei, data):
+
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.naive_bayes import GaussianNB
+    from sklearn.tree import DecisionTreeClassifier
+
+    X, y = data
+    params = dict(
+        k_outer=3, n_samples=2, sampling_strategy="undersampling", n_jobs=2
+    )
+
+    together = make_ei(**params)
+    together.train_base(
+        X[:, :3],
+        y,
+        base_predictors={"NB": GaussianNB(), "DT": DecisionTreeClassifier()},
+        modality="a",
+    )
+    together.train_base(
+        X[:, 3:], y, base_predictors={"LR": LogisticRegression()}, modality="b"
+    )
+
+    incremental = make_ei(**params)
+    incremental.train_base(
+        X[:, :3], y, base_predictors={"NB": GaussianNB()}, modality="a"
+    )
+    incremental.train_base(
+        X[:, 3:], y, base_predictors={"LR": LogisticRegression()}, modality="b"
+    )
+    incremental.add_base_predictors(
+        X[:, :3], y, base_predictors={"DT": DecisionTreeClassifier()}, modality="a"
+    )
+
+    for attribute in [
+        "meta_training_store",
+        "meta_test_store",
+        "meta_training_store_final",
+    ]:
+        expected = getattr(together, attribute)
+        result = getattr(incremental, attribute)
+        assert result.base_predictors == expected.base_predictors
+        for fold in range(expected.n_folds):
+            np.testing.assert_array_equal(result.array(fold), expected.array(fold))
+
+    # existing columns keep their order and new columns are appended
+    for key, summary in together.base_summary.items():
+        result = incremental.base_summary[key]
+        assert list(result.columns) == [("a", "NB"), ("b", "LR"), ("a", "DT")]
+        pd.testing.assert_frame_equal(result[summary.columns], summary)
+
+    meta_predictors = {"LR": LogisticRegression()}
+    together.train_meta(meta_predictors=meta_predictors)
+    incremental.train_meta(meta_predictors=meta_predictors)
+    X_dict = {"a": X[:5, :3], "b": X[:5, 3:]}
+    np.testing.assert_allclose(
+        incremental.predict(X_dict, "LR"), together.predict(X_dict, "LR")
+    )
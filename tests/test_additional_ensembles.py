@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def _reference_selection(X, y, scoring_func, max_ensemble_size, random_state):
+    # greedy selection recomputing the ensemble mean for every candidate
+    rng = np.random.default_rng(seed=random_state)
+    ranked = X.apply(lambda x: scoring_func(y, x)).sort_values(ascending=True)
+    ensemble = []
+    for i in range(min(max_ensemble_size, len(ranked))):
+        if len(ensemble) >= 2:
+            candidates = rng.choice(
+                ranked.index.values, min(50, len(ranked)), replace=False
+            )
+            scores = [
+                scoring_func(y, X[ensemble + [c]].mean(axis=1)) for c in candidates
+            ]
+            ensemble.append(candidates[np.argmax(scores)])
+        else:
+            ensemble.append(ranked.index.values[i])
+    return ensemble
+
+
+@pytest.mark.parametrize(
+    "scorer", ["f_minority_score", "roc_auc_score", "partial with columns"]
+)
+def test_ces_matches_reference_selection(scorer):
+
+    from functools import partial
+    from sklearn.metrics import roc_auc_score
+    from eipy.additional_ensembles import CES
+    from eipy.utils import f_minority_score, f_minority_score_columns
+
+    scoring_func, scoring_columns = {
+        "f_minority_score": (f_minority_score, None),
+        "roc_auc_score": (roc_auc_score, None),
+        "partial with columns": (partial(f_minority_score), f_minority_score_columns),
+    }[scorer]
+
+    rng = np.random.default_rng(0)
+    y = (rng.random(150) < 0.3).astype(int)
+    X = pd.DataFrame(
+        np.round(np.clip(0.3 * y[:, None] + 0.8 * rng.random((150, 60)), 0, 1), 2),
+        columns=[f"c{j}" for j in range(60)],
+    )
+
+    ces = CES(
+        scoring_func=scoring_func, max_ensemble_size=15, scoring_columns=scoring_columns
+    ).fit(X, y)
+    np.testing.assert_allclose(
+        ces.score_columns(y, X.to_numpy()), X.apply(lambda x: scoring_func(y, x))
+    )
+
+    assert ces.selected_ensemble == _reference_selection(X, y, scoring_func, 15, 0)
+    assert ces.predict_proba(X).shape == (150, 2)
+
+
+def test_bagged_ces():
+
+    from eipy.additional_ensembles import BaggedCES
+
+    rng = np.random.default_rng(1)
+    y = (rng.random(120) < 0.3).astype(int)
+    X = pd.DataFrame(
+        np.clip(0.3 * y[:, None] + 0.8 * rng.random((120, 20)), 0, 1),
+        columns=[f"c{j}" for j in range(20)],
+    )
+
+    bagged = BaggedCES(max_ensemble_size=5, n_bags=6, n_jobs=2).fit(X, y)
+    serial = BaggedCES(max_ensemble_size=5, n_bags=6, n_jobs=1).fit(X, y)
+
+    assert bagged.weights_.sum() == pytest.approx(1)
+    assert len(bagged.selected_ensemble) == 6 * 5
+    assert bagged.selected_ensemble == serial.selected_ensemble
+    np.testing.assert_allclose(
+        bagged.predict_proba(X)[:, 1],
+        (X[bagged.weights_.index] * bagged.weights_).sum(axis=1),
+    )
+
+
+def test_local_model_rank_reads_bagged_ces_selections(make_ei):
+
+    from sklearn.datasets import make_classification
+    from eipy.additional_ensembles import BaggedCES
+    from eipy.interpretation import PermutationInterpreter
+    from eipy.utils import f_minority_score, load_model
+
+    X, y = make_classification(n_samples=100, n_features=4, random_state=0)
+
+    EI = make_ei(
+        {"a": X},
+        y,
+        meta_predictors={"BCES": BaggedCES(max_ensemble_size=3, n_bags=4)},
+    )
+
+    interpreter = PermutationInterpreter(EI=EI, metric=f_minority_score)
+    interpreter.local_model_rank(["BCES"])
+
+    selected = load_model(EI.final_models["meta models"]["BCES"]).selected_ensemble
+    expected = [selected.count(("a", name)) for name in ["LR", "NB"]]
+    assert list(interpreter.LMR["local_importance_mean"]) == expected
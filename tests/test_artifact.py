@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+
+
+def test_directory_artifact_round_trip(make_ei, tmp_path):
+
+    from sklearn.datasets import make_classification
+    from sklearn.linear_model import LogisticRegression
+    from eipy.ei import EnsembleIntegration
+    from eipy.artifact import ModelFile
+
+    X, y = make_classification(n_samples=100, n_features=4, random_state=0)
+
+    EI = make_ei(
+        {"a": X[:, :2], "b": X[:, 2:]},
+        y,
+        meta_predictors={"LR": LogisticRegression()},
+    )
+    X_dict = {"a": X[:10, :2], "b": X[:10, 2:]}
+
+    EI.save(tmp_path / "EI", directory=True)
+    loaded = EnsembleIntegration.load(tmp_path / "EI")
+
+    assert isinstance(loaded.final_models["meta models"]["LR"], ModelFile)
+    assert isinstance(loaded.meta_test_store.blocks["a"][0], np.memmap)
+    np.testing.assert_array_equal(
+        loaded.meta_training_store.array(0), EI.meta_training_store.array(0)
+    )
+    np.testing.assert_array_equal(
+        loaded.fold_plan.outer[0][0], EI.fold_plan.outer[0][0]
+    )
+    np.testing.assert_allclose(
+        loaded.predict(X_dict, "LR"), EI.predict(X_dict, "LR")
+    )
+
+    # a loaded artifact can be saved again
+    loaded.save(tmp_path / "EI copy", directory=True)
+    copied = EnsembleIntegration.load(tmp_path / "EI copy", mmap_mode=None)
+    np.testing.assert_allclose(
+        copied.predict(X_dict, "LR"), EI.predict(X_dict, "LR")
+    )
+
+
+def test_baseline_pickle_trains(make_ei, data):
+
+    import pickle
+    from sklearn.linear_model import LogisticRegression
+    from eipy.ei import EnsembleIntegration
+
+    X, y = data
+    meta_predictors = {"LR": LogisticRegression()}
+    expected = make_ei({"a": X[:, :3], "b": X[:, 3:]}, y, meta_predictors)
+
+    # attributes of an object pickled before the MetaDataStore and the
+    # scheduling, caching, storage and bootstrap options were added
+    state = make_ei({"a": X[:, :3]}, y).__dict__.copy()
+    for name in ["meta_training_store", "meta_test_store", "meta_training_store_final"]:
+        state[name.replace("_store", "_data")] = state.pop(name).frames()
+    for name in [
+        "scheduling",
+        "memmap_folder",
+        "cache_dir",
+        "model_compression",
+        "compression_level",
+        "pickle_protocol",
+        "n_bootstrap",
+        "ci_level",
+        "fold_plan",
+        "_data_key",
+        "_predictor",
+    ]:
+        del state[name]
+    baseline = EnsembleIntegration.__new__(EnsembleIntegration)
+    baseline.__dict__.update(state)
+
+    EI = pickle.loads(pickle.dumps(baseline))
+    EI.train_base(X[:, 3:], y, modality="b")
+    EI.train_meta(meta_predictors=meta_predictors)
+
+    for fold in range(expected.meta_test_store.n_folds):
+        np.testing.assert_array_equal(
+            EI.meta_test_store.array(fold), expected.meta_test_store.array(fold)
+        )
+    pd.testing.assert_frame_equal(EI.meta_predictions, expected.meta_predictions)
+    for key, summary in expected.meta_summary.items():
+        pd.testing.assert_frame_equal(EI.meta_summary[key], summary)
+    X_dict = {"a": X[:5, :3], "b": X[:5, 3:]}
+    np.testing.assert_allclose(
+        EI.predict(X_dict, "LR"), expected.predict(X_dict, "LR")
+    )
+
+
+def test_models_are_read_when_predicting(make_ei, data, tmp_path, monkeypatch):
+
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.naive_bayes import GaussianNB
+    from eipy.artifact import ModelFile
+    from eipy.ei import EnsembleIntegration
+
+    X, y = data
+    EI = make_ei(
+        {"a": X[:, :3], "b": X[:, 3:]},
+        y,
+        meta_predictors={"LR": LogisticRegression(), "NB": GaussianNB()},
+    )
+    EI.save(tmp_path / "EI", directory=True)
+
+    reads = []
+    read = ModelFile.read
+
+    def counted_read(self):
+        reads.append(self)
+        return read(self)
+
+    monkeypatch.setattr(ModelFile, "read", counted_read)
+
+    loaded = EnsembleIntegration.load(tmp_path / "EI")
+    assert reads == []
+
+    # all base models and only the requested meta model, once
+    X_dict = {"a": X[:5, :3], "b": X[:5, 3:]}
+    n_base_models = sum(map(len, EI.final_models["base models"].values()))
+    for _ in range(2):
+        np.testing.assert_allclose(
+            loaded.predict(X_dict, "NB"), EI.predict(X_dict, "NB")
+        )
+        assert len(reads) == n_base_models + 1
+    assert reads[-1] is loaded.final_models["meta models"]["NB"]
+
+    loaded.predict(X_dict, "LR")
+    assert len(reads) == n_base_models + 2
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+
+def test_fold_plan_matches_nested_cross_validation():
+
+    from sklearn.model_selection import StratifiedKFold
+    from eipy.folds import FoldPlan
+
+    y = np.array([0, 1] * 20 + [0] * 10)
+    cv_outer = StratifiedKFold(n_splits=3, shuffle=True, random_state=0)
+    cv_inner = StratifiedKFold(n_splits=2, shuffle=True, random_state=0)
+
+    plan = FoldPlan.from_cv(y, cv_outer, cv_inner)
+
+    for (train_outer, test_outer), inner, (expected_train, expected_test) in zip(
+        plan.outer, plan.inner, cv_outer.split(y, y)
+    ):
+        assert train_outer.dtype == np.int32
+        np.testing.assert_array_equal(train_outer, expected_train)
+        np.testing.assert_array_equal(test_outer, expected_test)
+        for (train_inner, test_inner), (expected_train, expected_test) in zip(
+            inner, cv_inner.split(y[train_outer], y[train_outer])
+        ):
+            np.testing.assert_array_equal(train_inner, train_outer[expected_train])
+            np.testing.assert_array_equal(test_inner, train_outer[expected_test])
+
+    np.testing.assert_array_equal(
+        np.sort(plan.row_indices(plan.final_inner)), np.arange(len(y))
+    )
+
+    plan.check(y)
+    with pytest.raises(ValueError):
+        plan.check(y[::-1])
+
+
+def test_fold_plan_samples_are_shared():
+
+    from sklearn.model_selection import StratifiedKFold
+    from eipy.folds import FoldPlan
+
+    y = np.array([0, 0, 0, 1] * 15)
+    cv = StratifiedKFold(n_splits=3, shuffle=True, random_state=0)
+    plan = FoldPlan.from_cv(y, cv, cv)
+
+    train_index, _ = plan.outer[0]
+    samples = plan.samples(("outer", 0), train_index, "undersampling", [7, 8])
+
+    assert plan.samples(("outer", 0), train_index, "undersampling", [7, 8]) is samples
+    assert samples.shape == (2, 20)
+    for sample in samples:
+        assert set(sample).issubset(train_index)
+        assert np.bincount(y[sample]).tolist() == [10, 10]
+
+    # adding samples leaves existing ones unchanged
+    more = plan.samples(("outer", 0), train_index, "undersampling", [7, 8, 9])
+    np.testing.assert_array_equal(more[:2], samples)
+
+
+def test_sample_cache_keys_and_clearing(make_ei):
+
+    from sklearn.datasets import make_classification
+    from sklearn.naive_bayes import GaussianNB
+
+    X, y = make_classification(n_samples=60, n_features=4, random_state=0)
+    EI = make_ei(
+        {"a": X},
+        y,
+        base_predictors={"NB": GaussianNB()},
+        k_outer=3,
+        n_samples=2,
+        sampling_strategy="undersampling",
+    )
+    assert EI.fold_plan._samples == {}
+
+    # one cached entry per training set: inner, outer, final inner and final
+    list(EI._global_tasks(X, y))
+    assert len(EI.fold_plan._samples) == 3 * 2 + 3 + 2 + 1
+    list(EI._inner_fold_tasks(X, y, EI.fold_plan.final_inner, ("final inner", 0)))
+    assert len(EI.fold_plan._samples) == 3 * 2 + 3 + 2 + 1
@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize("sampling_aggregation", ["mean", None])
+def test_compiled_predictor_matches_final_models(make_ei, sampling_aggregation):
+
+    from sklearn.datasets import make_classification
+    from sklearn.linear_model import LogisticRegression
+    from eipy.additional_ensembles import MeanAggregation
+    from eipy.utils import load_model
+    import pandas as pd
+
+    X, y = make_classification(
+        n_samples=100, n_features=6, weights=[0.7, 0.3], random_state=0
+    )
+
+    EI = make_ei(
+        {"a": X[:, :3], "b": X[:, 3:]},
+        y,
+        meta_predictors={"Mean": MeanAggregation(), "LR": LogisticRegression()},
+        n_samples=2,
+        sampling_aggregation=sampling_aggregation,
+        n_jobs=2,
+    )
+
+    X_dict = {"a": X[:10, :3], "b": X[:10, 3:]}
+    predictor = EI.compile(n_jobs=2)
+    predictions = predictor.predict(X_dict)
+
+    # meta features built from the unpickled final base models
+    columns = EI.meta_training_store_final.X(
+        0, aggregate=sampling_aggregation == "mean"
+    ).columns
+    base_predictions = {
+        (modality, d["model name"], d["sample id"]): load_model(
+            d["pickled model"]
+        ).predict_proba(X_dict[modality])[:, 1]
+        for modality, models in EI.final_models["base models"].items()
+        for d in models
+    }
+    meta_features = pd.DataFrame(base_predictions)
+    if sampling_aggregation == "mean":
+        meta_features = meta_features.T.groupby(level=[0, 1]).mean().T
+    meta_features = meta_features[columns]
+
+    assert list(predictions.columns) == ["Mean", "LR"]
+    pd.testing.assert_frame_equal(
+        predictor.predict_base(X_dict), meta_features, check_names=False
+    )
+    for key in ["Mean", "LR"]:
+        meta_model = load_model(EI.final_models["meta models"][key])
+        expected = meta_model.predict_proba(meta_features)[:, 1]
+        np.testing.assert_allclose(predictor.predict(X_dict, key), expected)
+        np.testing.assert_allclose(predictions[key], expected)
+        np.testing.assert_allclose(EI.predict(X_dict, key), expected)
+
+    # the compiled predictor is reused until the final models change
+    compiled = EI._compiled_predictor()
+    assert compiled.n_jobs == EI.n_jobs
+    EI.predict(X_dict, "LR")
+    assert EI._compiled_predictor() is compiled
+    EI.train_meta()
+    assert EI._compiled_predictor() is not compiled
+
+
+def test_chunked_predictions_match_predict(make_ei, tmp_path):
+
+    import pandas as pd
+    from sklearn.datasets import make_classification
+    from sklearn.linear_model import LogisticRegression
+
+    X, y = make_classification(n_samples=100, n_features=4, random_state=0)
+
+    EI = make_ei(
+        {"a": X[:, :2], "b": X[:, 2:]},
+        y,
+        meta_predictors={"LR": LogisticRegression()},
+        base_predictors={"LR": LogisticRegression()},
+    )
+
+    expected = EI.predict({"a": X[:, :2], "b": X[:, 2:]}, "LR")
+
+    np.save(tmp_path / "a.npy", X[:, :2])
+    X_a = np.load(tmp_path / "a.npy", mmap_mode="r")
+    chunks = list(EI.predict_chunks({"a": X_a, "b": X[:, 2:]}, "LR", chunk_size=30))
+    assert [len(chunk) for chunk in chunks] == [30, 30, 30, 10]
+    np.testing.assert_allclose(np.concatenate(chunks), expected)
+
+    # iterables of row chunks, written to disk
+    X_dict = {
+        "a": (X[i : i + 25, :2] for i in range(0, 100, 25)),
+        "b": (X[i : i + 25, 2:] for i in range(0, 100, 25)),
+    }
+    path = tmp_path / "predictions.csv"
+    assert EI.compile().predict_to_file(X_dict, path) == 100
+    np.testing.assert_allclose(pd.read_csv(path)["LR"], expected)
+
+    # misaligned chunk iterables
+    for X_b in [
+        (X[i : i + 25, 2:] for i in range(0, 75, 25)),
+        (X[i : i + 20, 2:] for i in range(0, 100, 20)),
+    ]:
+        X_dict = {"a": (X[i : i + 25, :2] for i in range(0, 100, 25)), "b": X_b}
+        with pytest.raises(ValueError, match="different numbers"):
+            list(EI.predict_chunks(X_dict, "LR"))
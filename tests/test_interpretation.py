@@ -0,0 +1,247 @@
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def fitted_EI(make_ei):
+
+    from sklearn.datasets import make_classification
+    from sklearn.linear_model import LogisticRegression
+
+    X, y = make_classification(
+        n_samples=120, n_features=8, weights=[0.7, 0.3], random_state=0
+    )
+    X[:, 1] = X[:, 0] + 0.01 * np.random.default_rng(0).random(120)
+    X_dict = {"a": X[:, :5], "b": X[:, 5:]}
+
+    EI = make_ei(
+        X_dict,
+        y,
+        meta_predictors={"LR": LogisticRegression()},
+        n_samples=2,
+        sampling_strategy="undersampling",
+    )
+    return EI, X_dict, y
+
+
+def test_permutation_importances_match_sklearn():
+
+    from sklearn.datasets import make_classification
+    from sklearn.inspection import permutation_importance
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.metrics import make_scorer, roc_auc_score
+    from sklearn.naive_bayes import GaussianNB
+    from eipy.interpretation import permutation_importances
+
+    X, y = make_classification(n_samples=100, n_features=5, random_state=0)
+    models = [LogisticRegression().fit(X, y), GaussianNB().fit(X, y)]
+
+    importances = permutation_importances(
+        groups=[[model] for model in models],
+        X=X,
+        y=y,
+        metric=roc_auc_score,
+        n_repeats=4,
+        n_jobs=2,
+        random_state=0,
+    )
+
+    assert importances.shape == (2, 5, 4)
+    scorer = make_scorer(roc_auc_score, needs_proba=True)
+    for model, importances_model in zip(models, importances):
+        expected = permutation_importance(
+            model, X, y, scoring=scorer, n_repeats=4, random_state=0
+        )
+        np.testing.assert_allclose(importances_model, expected.importances)
+        assert importances_model.mean(axis=1) == pytest.approx(
+            expected.importances_mean
+        )
+
+
+def test_needs_proba_per_group():
+
+    from sklearn.datasets import make_classification
+    from sklearn.inspection import permutation_importance
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.metrics import make_scorer, roc_auc_score
+    from sklearn.svm import LinearSVC
+    from eipy.interpretation import permutation_importances
+
+    X, y = make_classification(n_samples=100, n_features=4, random_state=0)
+    samples = [LogisticRegression(C=c).fit(X, y) for c in [0.1, 1.0]]
+    svc = LinearSVC(random_state=0).fit(X, y)
+
+    importances = permutation_importances(
+        groups=[samples, [svc]],
+        X=X,
+        y=y,
+        metric=roc_auc_score,
+        needs_proba=[True, False],
+        n_repeats=3,
+        random_state=0,
+    )
+
+    class MeanProbability:
+        # samples are scored on their mean probability
+        classes_ = samples[0].classes_
+
+        def predict_proba(self, X):
+            return np.mean([model.predict_proba(X) for model in samples], axis=0)
+
+    for estimator, importances_group, needs_proba in [
+        (MeanProbability(), importances[0], True),
+        (svc, importances[1], False),
+    ]:
+        expected = permutation_importance(
+            estimator,
+            X,
+            y,
+            scoring=make_scorer(roc_auc_score, needs_proba=needs_proba),
+            n_repeats=3,
+            random_state=0,
+        )
+        np.testing.assert_allclose(importances_group, expected.importances)
+
+
+def test_feature_blocks_permuted_together():
+
+    from sklearn.datasets import make_classification
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.metrics import roc_auc_score
+    from eipy.interpretation import (
+        correlation_feature_groups,
+        permutation_importances,
+    )
+
+    X, y = make_classification(n_samples=100, n_features=4, random_state=0)
+    X = np.hstack([X, X[:, :1] + 0.01 * np.random.default_rng(0).random((100, 1))])
+    names = ["f0", "f1", "f2", "f3", "f0_copy"]
+
+    groups = correlation_feature_groups(X, names, threshold=0.9)
+    assert ["f0", "f0_copy"] in groups.values()
+    assert sum(len(features) for features in groups.values()) == 5
+
+    model = LogisticRegression().fit(X, y)
+    kwargs = dict(metric=roc_auc_score, n_repeats=3, random_state=0)
+    per_feature = permutation_importances([[model]], X, y, **kwargs)
+    blocks = permutation_importances(
+        [[model]], X, y, feature_groups=[[1], [0, 4]], **kwargs
+    )
+
+    assert blocks.shape == (1, 2, 3)
+    np.testing.assert_allclose(blocks[0, 0], per_feature[0, 1])
+    # permuting both copies of f0 hurts more than permuting either alone
+    assert blocks[0, 1].mean() >= per_feature[0, [0, 4]].mean(axis=1).max()
+
+
+def test_adaptive_repeats_continue_full_permutations():
+
+    from sklearn.datasets import make_classification
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.metrics import roc_auc_score
+    from eipy.interpretation import permutation_importances
+
+    X, y = make_classification(
+        n_samples=150, n_features=12, n_informative=3, random_state=0
+    )
+    model = LogisticRegression().fit(X, y)
+    kwargs = dict(metric=roc_auc_score, n_repeats=8, n_jobs=2, random_state=0)
+
+    full = permutation_importances([[model]], X, y, **kwargs)
+    adaptive = permutation_importances([[model]], X, y, min_repeats=2, **kwargs)
+
+    n_repeats = np.sum(~np.isnan(adaptive[0]), axis=1)
+    assert n_repeats.min() >= 2 and n_repeats.sum() < full[0].size
+    # repeats run are the first repeats of the full run
+    ran = ~np.isnan(adaptive)
+    assert np.all(ran[..., :-1] >= ran[..., 1:])
+    np.testing.assert_allclose(adaptive[ran], full[ran])
+
+
+def test_interpreter_feature_groups(fitted_EI):
+
+    from sklearn.metrics import roc_auc_score
+    from eipy.interpretation import PermutationInterpreter
+
+    EI, X_dict, y = fitted_EI
+
+    interpreter = PermutationInterpreter(
+        EI,
+        metric=roc_auc_score,
+        n_repeats=2,
+        feature_groups={"a": "correlation", "b": {"g1": ["b_0", "b_1"], "g2": ["b_2"]}},
+        correlation_threshold=0.9,
+    )
+    interpreter.rank_product_score(X_dict, y)
+
+    groups_a = interpreter.feature_groups_["a"]
+    assert ["a_0", "a_1"] in groups_a.values()
+    assert interpreter.feature_groups_["b"] == {"g1": ["b_0", "b_1"], "g2": ["b_2"]}
+
+    LFR = interpreter.LFR.set_index("modality")
+    assert set(LFR.loc["a", "local_feature_id"]) == set(groups_a)
+    assert sorted(LFR.loc["b", "local_feature_id"]) == ["g1", "g1", "g2", "g2"]
+
+    ranking = interpreter.ensemble_feature_ranking["LR"]
+    assert sorted(ranking["feature"]) == sorted(list(groups_a) + ["g1", "g2"])
+
+    for feature_groups in [{"b": {"g": ["b_0", "c_0"]}}, "clusters"]:
+        with pytest.raises(ValueError):
+            PermutationInterpreter(
+                EI, metric=roc_auc_score, feature_groups=feature_groups
+            ).local_feature_rank(X_dict, y)
+
+
+def test_interpreter_subsample_and_adaptive_repeats(fitted_EI):
+
+    from sklearn.inspection import permutation_importance
+    from sklearn.metrics import make_scorer, roc_auc_score
+    from eipy.interpretation import PermutationInterpreter
+    from eipy.utils import load_model
+
+    EI, X_dict, y = fitted_EI
+    meta_X = EI.meta_training_store_final.X(0, aggregate=True)
+    n_lfr_rows = 2 * (5 + 3)  # base predictors x features
+
+    # default settings: LMRs are sklearn's permutation importances
+    full = PermutationInterpreter(EI, metric=roc_auc_score, n_repeats=3)
+    full.local_feature_rank(X_dict, y).local_model_rank(["LR"])
+    expected = permutation_importance(
+        load_model(EI.final_models["meta models"]["LR"]),
+        meta_X,
+        EI.meta_training_store_final.labels[0],
+        scoring=make_scorer(roc_auc_score, needs_proba=True),
+        n_repeats=3,
+        random_state=EI.random_state,
+    )
+    np.testing.assert_allclose(
+        full.LMR["local_importance_mean"], expected.importances_mean
+    )
+    assert list(full.budget_["name"]) == ["a", "b", "LR"]
+    assert (full.budget_["fraction of full budget"] == 1).all()
+
+    all_rows = PermutationInterpreter(
+        EI, metric=roc_auc_score, n_repeats=3, subsample=1.0
+    ).local_feature_rank(X_dict, y)
+    np.testing.assert_array_equal(all_rows.LFR.to_numpy(), full.LFR.to_numpy())
+
+    adaptive = PermutationInterpreter(
+        EI, metric=roc_auc_score, n_repeats=6, subsample=0.5, min_repeats=2
+    )
+    adaptive.local_feature_rank(X_dict, y).local_model_rank(["LR"])
+
+    assert adaptive.LFR.shape == (n_lfr_rows, full.LFR.shape[1])
+    assert adaptive.LMR.shape == (meta_X.shape[1], full.LMR.shape[1])
+    budget = adaptive.budget_.set_index("name")
+    assert (budget["rows"] == 60).all() and (budget["total rows"] == 120).all()
+    assert list(budget["features"]) == [5, 3, meta_X.shape[1]]
+    assert (budget["repeats"] >= 2 * budget["features"]).all()
+    assert (budget["repeats"] <= budget["full repeats"]).all()
+    np.testing.assert_allclose(
+        budget["fraction of full budget"],
+        0.5 * budget["repeats"] / (6 * budget["features"]),
+    )
+
+    for subsample, error in [(0, ValueError), (-0.5, ValueError), ("half", TypeError)]:
+        with pytest.raises(error):
+            PermutationInterpreter(EI, metric=roc_auc_score, subsample=subsample)
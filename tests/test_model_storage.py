@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize("compression", [None, "zlib", "lzma"])
+def test_dump_model_round_trip(compression):
+
+    from sklearn.ensemble import RandomForestClassifier
+    from eipy.utils import dump_model, load_model
+
+    X = np.random.default_rng(0).random((50, 3))
+    y = np.arange(50) % 2
+    model = RandomForestClassifier(n_estimators=5, random_state=0).fit(X, y)
+
+    model_bytes = dump_model(model, compression=compression, level=1, protocol=4)
+    loaded = load_model(model_bytes)
+
+    np.testing.assert_array_equal(loaded.predict_proba(X), model.predict_proba(X))
+    if compression is not None:
+        assert len(model_bytes) < len(dump_model(model))
+
+
+def test_compressed_final_models(make_ei):
+
+    from sklearn.datasets import make_classification
+    from sklearn.linear_model import LogisticRegression
+
+    X, y = make_classification(n_samples=100, n_features=4, random_state=0)
+
+    def train(**kwargs):
+        return make_ei(
+            {"a": X},
+            y,
+            meta_predictors={"LR": LogisticRegression()},
+            base_predictors={"LR": LogisticRegression()},
+            **kwargs,
+        )
+
+    EI = train()
+    compressed = train(model_compression="lzma", compression_level=9)
+
+    sizes = compressed.final_model_sizes()
+    assert list(sizes["kind"]) == ["base", "meta"]
+    assert (sizes["bytes"] < EI.final_model_sizes()["bytes"]).all()
+    np.testing.assert_allclose(
+        compressed.predict({"a": X}, "LR"), EI.predict({"a": X}, "LR")
+    )
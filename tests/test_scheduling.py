@@ -0,0 +1,171 @@
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def train(make_ei, data):
+
+    X, y = data
+
+    def train(scheduling, **kwargs):
+        return make_ei(
+            {"a": X[:, :3], "b": X[:, 3:]},
+            y,
+            k_outer=3,
+            n_samples=2,
+            sampling_strategy="undersampling",
+            n_jobs=2,
+            scheduling=scheduling,
+            **kwargs,
+        )
+
+    return train
+
+
+def test_global_scheduling_matches_phased(train):
+
+    phased = train("phased")
+    global_ = train("global")
+
+    for attribute in [
+        "meta_training_store",
+        "meta_test_store",
+        "meta_training_store_final",
+    ]:
+        expected = getattr(phased, attribute)
+        result = getattr(global_, attribute)
+        for fold in range(expected.n_folds):
+            np.testing.assert_array_equal(result.array(fold), expected.array(fold))
+            np.testing.assert_array_equal(result.labels[fold], expected.labels[fold])
+            np.testing.assert_array_equal(
+                result.row_indices[fold], expected.row_indices[fold]
+            )
+
+    for modality, models in phased.final_models["base models"].items():
+        result = global_.final_models["base models"][modality]
+        assert [(d["model name"], d["sample id"]) for d in result] == [
+            (d["model name"], d["sample id"]) for d in models
+        ]
+
+
+def test_task_payload_excludes_ensemble_state(train):
+
+    import pickle
+
+    EI = train("phased")
+    X = np.zeros((120, 3))
+    y = np.zeros(120, dtype=int)
+    y[::3] = 1
+    data_bytes = len(pickle.dumps((X, y)))
+
+    tasks = list(EI._outer_tasks(X, y, EI.fold_plan.outer, "outer")) + list(
+        EI._inner_fold_tasks(X, y, EI.fold_plan.final_inner, "final inner")
+    )
+    for func, args, kwargs in tasks:
+        task_bytes = len(pickle.dumps((func, args, kwargs)))
+        # data plus estimator, indices and sampling configuration only
+        assert task_bytes - data_bytes < 5000
+
+
+def test_memmapped_modalities_match_in_memory(train, tmp_path):
+
+    import gc
+    import sys
+
+    memmap_folder = tmp_path / "memmaps"  # created on first use
+    expected = train("phased")
+    result = train("phased", memmap_folder=str(memmap_folder))
+
+    for fold in range(expected.meta_test_store.n_folds):
+        np.testing.assert_array_equal(
+            result.meta_test_store.array(fold), expected.meta_test_store.array(fold)
+        )
+
+    # memmap files are removed once the memory maps are released; Windows
+    # keeps files of recently closed maps locked, so skip the check there
+    del result
+    gc.collect()
+    if sys.platform != "win32":
+        assert list(memmap_folder.iterdir()) == []
+
+
+def test_cached_results_are_reused(train, tmp_path):
+
+    first = train("global", cache_dir=str(tmp_path))
+    cached = sorted(tmp_path.iterdir())
+    assert len(cached) > 0
+
+    second = train("phased", cache_dir=str(tmp_path))
+    assert sorted(tmp_path.iterdir()) == cached
+
+    for fold in range(first.meta_training_store.n_folds):
+        np.testing.assert_array_equal(
+            second.meta_training_store.array(fold),
+            first.meta_training_store.array(fold),
+        )
+
+
+def test_unknown_scheduling_raises():
+
+    from eipy.ei import EnsembleIntegration
+
+    with pytest.raises(ValueError, match="scheduling"):
+        EnsembleIntegration(scheduling="Global")
+
+
+def test_cache_keys_include_model_storage(train, tmp_path):
+
+    from eipy.utils import load_model
+
+    train("phased", cache_dir=str(tmp_path))
+    compressed = train("phased", cache_dir=str(tmp_path), model_compression="zlib")
+
+    for d in compressed.final_models["base models"]["a"]:
+        assert d["pickled model"][:1] == b"\x78"
+        load_model(d["pickled model"])
+
+
+def test_parallel_meta_training_matches_serial_fits(train):
+
+    import pandas as pd
+    from sklearn.base import clone
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.linear_model import LogisticRegression
+    from eipy.additional_ensembles import MeanAggregation
+    from eipy.utils import load_model, metric_threshold_dataframes
+
+    EI = train("phased")
+    meta_predictors = {
+        "Mean": MeanAggregation(),
+        "LR": LogisticRegression(),
+        "RF": RandomForestClassifier(n_estimators=10),
+    }
+    EI.train_meta(meta_predictors=meta_predictors)
+
+    # one meta predictor and outer fold at a time, as before parallelization
+    expected = {}
+    for name, model in meta_predictors.items():
+        y_pred = []
+        for fold in range(EI.k_outer):
+            fitted = clone(model).fit(
+                EI.meta_training_store.X(fold, aggregate=True),
+                EI.meta_training_store.labels[fold],
+            )
+            y_pred.append(
+                fitted.predict_proba(EI.meta_test_store.X(fold, aggregate=True))[:, 1]
+            )
+        expected[name] = np.concatenate(y_pred)
+    expected["labels"] = np.concatenate(EI.meta_test_store.labels)
+    expected = pd.DataFrame(expected)
+
+    pd.testing.assert_frame_equal(EI.meta_predictions, expected)
+    for key, summary in metric_threshold_dataframes(expected).items():
+        pd.testing.assert_frame_equal(EI.meta_summary[key], summary)
+
+    X_final = EI.meta_training_store_final.X(0, aggregate=True)
+    for name, model in meta_predictors.items():
+        fitted = clone(model).fit(X_final, EI.meta_training_store_final.labels[0])
+        np.testing.assert_array_equal(
+            load_model(EI.final_models["meta models"][name]).predict_proba(X_final),
+            fitted.predict_proba(X_final),
+        )
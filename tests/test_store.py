@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+
+
+def test_meta_data_store_frames_round_trip():
+
+    from eipy.store import MetaDataStore
+
+    rng = np.random.default_rng(0)
+    labels = [rng.integers(0, 2, 6), rng.integers(0, 2, 4)]
+
+    store = MetaDataStore()
+    store.add_modality(
+        "m1", ["LR", "DT"], [rng.random((6, 2, 3)), rng.random((4, 2, 3))], labels
+    )
+    store.add_modality(
+        "m0", ["NB"], [rng.random((6, 1, 3)), rng.random((4, 1, 3))], labels
+    )
+
+    frames = store.frames()
+    assert list(frames[0].columns[:2]) == [("m1", "LR", 0), ("m1", "LR", 1)]
+    assert frames[1].columns[-1][0] == "labels"
+    np.testing.assert_array_equal(frames[1]["labels"], labels[1])
+
+    # aggregated views match groupby on the DataFrame layout
+    X = frames[0].drop(columns=["labels"], level=0)
+    expected = X.groupby(level=[0, 1], axis=1).mean()
+    pd.testing.assert_frame_equal(
+        store.X(0, aggregate=True), expected, check_names=False
+    )
+
+    rebuilt = MetaDataStore.from_frames(frames)
+    for fold in range(2):
+        pd.testing.assert_frame_equal(rebuilt.frame(fold), frames[fold])
+
+
+def test_meta_data_store_caches_aggregated_views():
+
+    from eipy.store import MetaDataStore
+
+    rng = np.random.default_rng(1)
+    labels = [rng.integers(0, 2, 5)]
+
+    store = MetaDataStore()
+    store.add_modality("m1", ["LR"], [rng.random((5, 1, 2))], labels)
+    X = store.X(0, aggregate=True)
+    assert store.X(0, aggregate=True) is X
+
+    # adding a modality invalidates the cached views
+    store.add_modality("m2", ["LR"], [rng.random((5, 1, 2))], labels)
+    assert store.X(0, aggregate=True).shape == (5, 2)
+
+
+def test_combined_predictions_match_frame_path():
+
+    from eipy.ei import EnsembleIntegration
+    from eipy.store import MetaDataStore
+    from eipy.utils import create_base_summary
+
+    rng = np.random.default_rng(2)
+    base_predictors = ["LR", "NB"]
+    EI = EnsembleIntegration(
+        base_predictors={name: None for name in base_predictors},
+        n_samples=2,
+        k_outer=2,
+        verbose=0,
+    )
+    fold_sizes = [5, 4]
+    fold_labels = [rng.integers(0, 2, size) for size in fold_sizes]
+    results = [
+        {
+            "fold id": fold_id,
+            "model name": name,
+            "sample id": sample_id,
+            "y_pred": rng.random(size),
+            "labels": fold_labels[fold_id],
+        }
+        for fold_id, size in enumerate(fold_sizes)
+        for name in base_predictors
+        for sample_id in range(2)
+    ]
+    results = [results[i] for i in rng.permutation(len(results))]
+
+    def frame(fold_ids):
+        # one column per (base predictor, sample), as in the DataFrame path
+        columns = {
+            ("a", name, sample_id): np.concatenate(
+                [
+                    d["y_pred"]
+                    for fold_id in fold_ids
+                    for d in results
+                    if (d["fold id"], d["model name"], d["sample id"])
+                    == (fold_id, name, sample_id)
+                ]
+            )
+            for name in base_predictors
+            for sample_id in range(2)
+        }
+        df = pd.DataFrame(columns).rename_axis(
+            ["modality", "base predictor", "sample"], axis=1
+        )
+        df["labels"] = np.concatenate([fold_labels[i] for i in fold_ids])
+        return df
+
+    predictions, labels = EI._combine_predictions_inner(results)
+    store = MetaDataStore().add_modality("a", base_predictors, [predictions], [labels])
+    pd.testing.assert_frame_equal(store.frame(0), frame([0, 1]), check_names=False)
+
+    store = MetaDataStore()
+    predictions, labels = zip(*EI._combine_predictions_outer(results))
+    store.add_modality("a", base_predictors, list(predictions), list(labels))
+    expected = [frame([0]), frame([1])]
+    for fold in range(2):
+        pd.testing.assert_frame_equal(
+            store.frame(fold), expected[fold], check_names=False
+        )
+    for key, summary in create_base_summary(store).items():
+        pd.testing.assert_frame_equal(summary, create_base_summary(expected)[key])
@@ -0,0 +1,140 @@
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize("positive_rate", [0.2, 0.8])
+def test_scores_match_sklearn(positive_rate):
+
+    from sklearn.metrics import roc_auc_score, matthews_corrcoef
+    from eipy.utils import scores, fmeasure_score
+
+    rng = np.random.default_rng(0)
+    y = (rng.random(300) < positive_rate).astype(int)
+    y_pred = np.round(np.clip(0.3 * y + 0.7 * rng.random(300), 0, 1), 2)
+
+    result = scores(y, y_pred)
+
+    minor_class = 0 if np.bincount(y)[0] < np.bincount(y)[1] else 1
+    fmax = fmeasure_score(y, y_pred, pos_label=minor_class)
+    assert result["fmax (minority)"][0] == pytest.approx(fmax["F"])
+    assert result["fmax (minority)"][1] == pytest.approx(fmax["thres"])
+
+    assert result["AUC"][0] == pytest.approx(roc_auc_score(y, y_pred))
+
+    # exact max MCC is at least as good as any single threshold
+    mcc, threshold = result["max MCC"]
+    assert mcc == pytest.approx(matthews_corrcoef(y, y_pred >= threshold))
+    for t in np.unique(y_pred):
+        assert mcc >= matthews_corrcoef(y, y_pred >= t) - 1e-12
+
+
+def test_metric_threshold_dataframes_matches_scores():
+
+    import pandas as pd
+    from eipy.utils import metric_threshold_dataframes, scores
+
+    rng = np.random.default_rng(1)
+    y = (rng.random(200) < 0.3).astype(int)
+    df = pd.DataFrame(np.round(0.2 * y[:, None] + rng.random((200, 6)), 2))
+    df["labels"] = y
+
+    summary = metric_threshold_dataframes(df, n_jobs=2)
+
+    for column in range(6):
+        for metric, (score, threshold) in scores(y, df[column]).items():
+            assert summary["metrics"].loc[metric, column] == pytest.approx(score)
+            assert summary["thresholds"].loc[metric, column] == pytest.approx(
+                threshold, nan_ok=True
+            )
+
+
+def test_binned_metrics_within_error_bounds():
+
+    from eipy.utils import BinnedMetrics, score_matrix
+
+    rng = np.random.default_rng(2)
+    y = (rng.random(5000) < 0.25).astype(int)
+    y_pred = np.clip(0.2 * y[:, None] + 0.8 * rng.random((5000, 3)), 0, 1)
+
+    exact, _ = score_matrix(y, y_pred)
+
+    # accumulate chunk by chunk and merge, as across folds
+    binned = BinnedMetrics(n_bins=200)
+    for chunk in np.array_split(np.arange(5000), 7):
+        binned.merge(BinnedMetrics(n_bins=200).update(y[chunk], y_pred[chunk]))
+    approx, _ = binned.score()
+    bounds = binned.error_bounds()
+
+    assert np.all(exact[0] - approx[0] >= -1e-12)
+    assert np.all(exact[0] - approx[0] <= bounds["fmax (minority)"])
+    assert np.all(np.abs(exact[2] - approx[2]) <= bounds["AUC"])
+    assert np.all(exact[3] - approx[3] >= -1e-12)
+
+
+def test_bootstrap_metrics_bracket_scores():
+
+    import pandas as pd
+    from eipy.utils import metric_threshold_dataframes
+
+    rng = np.random.default_rng(3)
+    y = (rng.random(300) < 0.3).astype(int)
+    df = pd.DataFrame(np.clip(0.3 * y[:, None] + rng.random((300, 4)), 0, 1))
+    df["labels"] = y
+
+    summary = metric_threshold_dataframes(df, n_bootstrap=200, random_state=0)
+    repeat = metric_threshold_dataframes(df, n_bootstrap=200, random_state=0)
+
+    assert set(summary) == {"metrics", "thresholds", "lower", "upper"}
+    pd.testing.assert_frame_equal(summary["lower"], repeat["lower"])
+    for metric in ["fmax (minority)", "AUC", "max MCC"]:
+        assert (summary["lower"].loc[metric] <= summary["metrics"].loc[metric]).all()
+        assert (summary["upper"].loc[metric] >= summary["metrics"].loc[metric]).all()
+
+
+def test_bootstrap_resamples_shared_by_columns():
+
+    from eipy.utils import bootstrap_metrics
+
+    rng = np.random.default_rng(4)
+    y = (rng.random(200) < 0.3).astype(int)
+    y_pred = np.clip(0.3 * y[:, None] + rng.random((200, 3)), 0, 1)
+
+    kwargs = dict(n_bootstrap=50, random_state=0, block_size=20)
+    lower, upper = bootstrap_metrics(y, y_pred, n_jobs=2, **kwargs)
+    for column in range(3):
+        lower_column, upper_column = bootstrap_metrics(y, y_pred[:, column], **kwargs)
+        np.testing.assert_array_equal(lower[:, column], lower_column[:, 0])
+        np.testing.assert_array_equal(upper[:, column], upper_column[:, 0])
+
+
+@pytest.mark.parametrize(
+    "strategy, counts",
+    [(None, [70, 30]), ("undersampling", [30, 30]), ("oversampling", [70, 70]),
+     ("hybrid", [50, 50])],
+)
+def test_sample_indices_balance_classes(strategy, counts):
+
+    from eipy.utils import sample, sample_indices
+
+    y = np.array([0] * 70 + [1] * 30)
+    np.random.default_rng(0).shuffle(y)
+    X = np.arange(100)
+
+    for seed in [1, 2]:
+        indices = sample_indices(y, strategy, random_state=seed)
+        assert np.bincount(y[indices]).tolist() == counts
+        # each sample is determined by its own seed
+        np.testing.assert_array_equal(
+            indices, sample_indices(y, strategy, random_state=seed)
+        )
+        np.testing.assert_array_equal(sample(X, y, strategy, seed)[0], indices)
+
+
+def test_binned_metrics_without_counts_raise():
+
+    from eipy.utils import BinnedMetrics
+
+    with pytest.raises(ValueError, match="no counts"):
+        BinnedMetrics().score()
+    with pytest.raises(ValueError, match="no counts"):
+        BinnedMetrics().error_bounds()